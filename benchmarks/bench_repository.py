@@ -0,0 +1,284 @@
+"""Latency/throughput benchmarks for tale_repository.
+
+Seeds a scratch schema (`tale_bench` by default) in the PostgreSQL
+database named by TALE_BENCH_DSN with 10k/100k/1M generated stories and
+times the queries the GUI runs: the streamed table load, keyset pages,
+search, row fetches, CRUD, the streak update and the similar-stories
+index.
+
+    TALE_BENCH_DSN="dbname=tale_bench user=shane" \
+        python benchmarks/bench_repository.py --sizes 10000,100000 --json run.json
+
+Pass --baseline with an earlier --json file to fail on regressions.
+The schema is dropped afterwards unless --keep is given; point the DSN at
+a database you don't mind being written to.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tale_repository as repo  # noqa: E402
+
+GENRES = ["Romance", "Drama", "Fantasy", "Mystery", "Horror", "Sci-Fi", "Adventure"]
+STATUSES = ["Ongoing", "Completed", "Hiatus"]
+WORDS = ("dragon castle winter letter garden river shadow crown stranger "
+         "harbor lantern midnight orchard storm library mirror forest "
+         "promise secret thief queen sailor violin ember meadow").split()
+SEARCH_TERMS = ["dragon", "sha", "mid", "winter garden", "librar", "xyzzy", "qu"]
+SEED_BATCH = 50000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples, rows=None):
+    """Turn a list of per-operation timings (seconds) into a result dict."""
+    total = sum(samples)
+    result = {
+        "ops": len(samples),
+        "p50_ms": statistics.median(samples) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "max_ms": max(samples) * 1000,
+        "ops_per_s": len(samples) / total if total else 0.0,
+    }
+    if rows is not None:
+        result["rows_per_s"] = rows / total if total else 0.0
+    return result
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+# ---------- seeding ----------
+def fake_story(rng, n):
+    started = date(2015, 1, 1) + timedelta(days=rng.randrange(3000))
+    words = rng.sample(WORDS, 4)
+    return (
+        rng.random() < 0.1,
+        f"The {words[0]} of the {words[1]} {n}",
+        f"Author {rng.randrange(2000)}",
+        rng.choice(GENRES),
+        started,
+        started + timedelta(days=rng.randrange(400)) if rng.random() < 0.4 else None,
+        rng.choice(STATUSES),
+        rng.randrange(1, 80),
+        rng.randrange(500, 250000),
+        f"{words[2].title()} {rng.randrange(500)}",
+        started + timedelta(days=rng.randrange(500)),
+        " ".join(rng.choice(WORDS) for _ in range(30)),
+    )
+
+
+def seed(con, schema, count, rng):
+    """Recreate `schema` with the app's tables and `count` stories."""
+    cur = con.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {schema}")
+    con.commit()
+    repo.init_database(con)
+    columns = ", ".join(repo.IMPORT_COLUMNS)
+    for start in range(0, count, SEED_BATCH):
+        buf = io.StringIO()
+        for n in range(start, min(count, start + SEED_BATCH)):
+            buf.write("\t".join(repo._copy_field(v) for v in fake_story(rng, n)) + "\n")
+        buf.seek(0)
+        cur.copy_expert(f"COPY stories ({columns}) FROM STDIN", buf)
+    con.commit()
+    con.autocommit = True
+    cur.execute("VACUUM ANALYZE stories")
+    con.autocommit = False
+
+
+# ---------- cases ----------
+def bench_load(con, count, rng, repeat):
+    samples, first_chunk = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        seen = []
+
+        def on_chunk(rows):
+            if not seen:
+                first_chunk.append(time.perf_counter() - start)
+            seen.append(len(rows))
+
+        repo.stream_stories(con, on_chunk)
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples, rows=count * repeat)
+    result["first_chunk_ms"] = statistics.median(first_chunk) * 1000
+    return result
+
+
+def bench_pages(con, count, rng, repeat):
+    samples = []
+    for sort in ("Title", "Words", "Updated"):
+        after = None
+        for _ in range(repeat):
+            elapsed, (ids, after) = timed(repo.query_story_page, con,
+                                          {"genre": "Fantasy"}, sort, True, after)
+            samples.append(elapsed)
+            if not ids:
+                break
+    return summarize(samples)
+
+
+def bench_search(con, count, rng, repeat):
+    samples = []
+    for _ in range(repeat):
+        for term in SEARCH_TERMS:
+            samples.append(timed(repo.search_story_ids, con, term)[0])
+    return summarize(samples)
+
+
+def bench_fetch(con, count, rng, repeat):
+    samples = []
+    for _ in range(repeat * 10):
+        first = rng.randrange(1, max(2, count - 60))
+        samples.append(timed(repo.fetch_story_rows, con, range(first, first + 60))[0])
+    return summarize(samples, rows=60 * len(samples))
+
+
+def bench_crud(con, count, rng, repeat):
+    inserts, reads, updates, deletes = [], [], [], []
+    for n in range(repeat * 10):
+        story = repo.Story(*(None,) + fake_story(rng, count + n))
+        elapsed, story = timed(repo.insert_story, con, story.values())
+        inserts.append(elapsed)
+        story_id = story.id
+        elapsed, story = timed(repo.get_story, con, story_id)
+        reads.append(elapsed)
+        story.word_count += 100
+        updates.append(timed(repo.update_story, con, story_id, story.values(),
+                             story.version)[0])
+        deletes.append(timed(repo.delete_story, con, story_id)[0])
+    return {"insert": summarize(inserts), "get": summarize(reads),
+            "update": summarize(updates), "delete": summarize(deletes)}
+
+
+def bench_streak(con, count, rng, repeat):
+    reads, stats, derive = [], [], []
+    for _ in range(repeat * 10):
+        reads.append(timed(repo.record_read, con, rng.randrange(1, count + 1))[0])
+        stats.append(timed(repo.get_activity_stats, con)[0])
+    for _ in range(repeat):
+        derive.append(timed(repo.derive_streak, con)[0])
+    return {"record_read": summarize(reads), "stats": summarize(stats),
+            "derive": summarize(derive)}
+
+
+def bench_similar(con, count, rng, repeat):
+    if repo.np is None:
+        return {}  # NumPy not installed
+    with tempfile.TemporaryDirectory() as tmp:
+        index = repo.SimilarityIndex(os.path.join(tmp, "similar.npz"))
+        build, _ = timed(repo.sync_similarity_index, con, index)
+    queries = [timed(index.similar, rng.randrange(1, count + 1))[0]
+               for _ in range(repeat * 20)]
+    return {"build": summarize([build], rows=count), "query": summarize(queries)}
+
+
+CASES = {
+    "load": bench_load,
+    "pages": bench_pages,
+    "search": bench_search,
+    "fetch": bench_fetch,
+    "crud": bench_crud,
+    "streak": bench_streak,
+    "similar": bench_similar,
+}
+
+
+# ---------- reporting ----------
+def flatten(results, prefix=""):
+    """Yield (name, metrics) for every leaf result."""
+    for key, value in results.items():
+        if "p50_ms" in value:
+            yield prefix + key, value
+        else:
+            yield from flatten(value, f"{prefix}{key}.")
+
+
+def report(results):
+    print(f"{'case':<28}{'ops':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'ops/s':>11}")
+    for name, m in flatten(results):
+        print(f"{name:<28}{m['ops']:>7}{m['p50_ms']:>10.2f}{m['p95_ms']:>10.2f}"
+              f"{m['max_ms']:>10.2f}{m['ops_per_s']:>11.1f}")
+
+
+def regressions(results, baseline, tolerance):
+    """Return a line per case whose p95 grew more than `tolerance` (0.25 = 25%)."""
+    old = dict(flatten(baseline))
+    found = []
+    for name, m in flatten(results):
+        if name in old and m["p95_ms"] > old[name]["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {old[name]['p95_ms']:.2f} -> {m['p95_ms']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dsn", default=os.environ.get("TALE_BENCH_DSN"),
+                        help="libpq connection string (default: $TALE_BENCH_DSN)")
+    parser.add_argument("--schema", default="tale_bench")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated story counts to seed")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p95 growth over the baseline (default 0.25)")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("set TALE_BENCH_DSN or pass --dsn")
+
+    con = psycopg2.connect(args.dsn, options=f"-c search_path={args.schema},public")
+    results = {}
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            rng = random.Random(args.seed)
+            print(f"seeding {size:,} stories...", flush=True)
+            elapsed, _ = timed(seed, con, args.schema, size, rng)
+            results[str(size)] = {"seed": summarize([elapsed], rows=size)}
+            for case in args.cases.split(","):
+                results[str(size)][case] = CASES[case](con, size, rng, args.repeat)
+            print(f"\n{size:,} stories")
+            report(results[str(size)])
+            print()
+    finally:
+        if not args.keep:
+            con.rollback()
+            con.cursor().execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+            con.commit()
+        con.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print("REGRESSION", line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
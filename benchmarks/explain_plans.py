@@ -0,0 +1,187 @@
+"""Query-plan regression check for the hot tale_repository queries.
+
+Seeds a scratch schema the same way bench_repository.py does, runs each
+hot helper once so its statement is prepared exactly as the app prepares
+it, then EXPLAIN (ANALYZE, BUFFERS)es the prepared statement several times.
+
+    TALE_BENCH_DSN="dbname=tale_bench user=shane" \
+        python benchmarks/explain_plans.py --size 100000 --json plans.json
+
+With --baseline (an earlier --json file) it exits non-zero when a plan's
+shape changed, a sequential scan appeared on a large table, or the median
+execution time grew past --tolerance. Without one, sequential scans on large
+tables are still reported.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tale_repository as repo  # noqa: E402
+from bench_repository import seed  # noqa: E402
+
+# tables a sequential scan should never touch in the hot paths
+LARGE_TABLES = {"stories", "chapters", "activity_events", "library_entries"}
+NOISE_MS = 1.0  # execution time changes below this are ignored
+
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    """Remember the EXECUTE statements issued through execute_prepared."""
+
+    executed = []
+
+    def execute(self, query, vars=None):
+        if query.startswith("EXECUTE "):
+            RecordingCursor.executed.append((query, vars))
+        return super().execute(query, vars)
+
+
+# ---------- cases ----------
+def hot_queries(size, rng):
+    """Yield (name, fn, args) for every prepared hot query, as the GUI calls them."""
+    first = rng.randrange(1, max(2, size - 60))
+    story_id = rng.randrange(1, size + 1)
+    yield "fetch_rows", repo.fetch_story_rows, (range(first, first + 60),)
+    yield "get_story", repo.get_story, (story_id,)
+    yield "preview", repo.fetch_preview, (story_id,)
+    yield "chapters", repo.fetch_chapters, (story_id,)
+    yield "search_short", repo.search_story_ids, ("mi",)
+    yield "search", repo.search_story_ids, ("winter garden",)
+    yield "page_id", repo.query_story_page, ()
+    yield "page_title", repo.query_story_page, ({"genre": "Fantasy"}, "Title", True)
+    yield "page_words", repo.query_story_page, ({}, "Words", True, (100000, size // 2))
+    yield "activity_stats", repo.get_activity_stats, ()
+    yield "record_read", repo.record_read, (story_id,)
+
+
+def update_case(con, size, rng):
+    """update_story needs the row's current version, so it is set up here."""
+    story = repo.get_story(con, rng.randrange(1, size + 1))
+    return "update_story", repo.update_story, (story.id, story.values(), story.version)
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from walk(child)
+
+
+def summarize_plan(plan):
+    """Reduce one EXPLAIN (FORMAT JSON) result to the fields compared across runs."""
+    nodes = list(walk(plan["Plan"]))
+    return {
+        "shape": [" ".join(filter(None, (n["Node Type"], n.get("Relation Name"),
+                                         n.get("Index Name")))) for n in nodes],
+        "seq_scans": sorted({n["Relation Name"] for n in nodes
+                             if n["Node Type"] == "Seq Scan"} & LARGE_TABLES),
+        "shared_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": plan["Plan"].get("Shared Read Blocks", 0),
+        "execution_ms": plan["Execution Time"],
+        "planning_ms": plan.get("Planning Time", 0.0),
+    }
+
+
+def explain(con, name, fn, args, repeat):
+    """Prepare `fn`'s statement, then EXPLAIN ANALYZE it `repeat` times (rolled back)."""
+    RecordingCursor.executed.clear()
+    fn(con, *args)
+    results = {}
+    cur = con.cursor()
+    for n, (query, params) in enumerate(RecordingCursor.executed):
+        runs = []
+        for _ in range(repeat):
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+            runs.append(summarize_plan(cur.fetchone()[0][0]))
+            con.rollback()
+        result = runs[-1]
+        result["execution_ms"] = statistics.median(r["execution_ms"] for r in runs)
+        result["statement"] = query.split()[1]
+        results[name if n == 0 else f"{name}.{n}"] = result
+    return results
+
+
+# ---------- reporting ----------
+def report(plans):
+    print(f"{'query':<20}{'exec ms':>10}{'hit':>8}{'read':>8}  plan")
+    for name, p in plans.items():
+        print(f"{name:<20}{p['execution_ms']:>10.3f}{p['shared_hit']:>8}"
+              f"{p['shared_read']:>8}  {' > '.join(p['shape'])}")
+
+
+def problems(plans, baseline, tolerance):
+    """Return a line per plan change, new seq scan or slowdown against `baseline`."""
+    found = []
+    for name, p in plans.items():
+        old = baseline.get(name)
+        if old is None:
+            found.extend(f"{name}: seq scan on {t}" for t in p["seq_scans"])
+            continue
+        for table in set(p["seq_scans"]) - set(old["seq_scans"]):
+            found.append(f"{name}: new seq scan on {table}")
+        if p["shape"] != old["shape"]:
+            found.append(f"{name}: plan changed\n    was {' > '.join(old['shape'])}"
+                         f"\n    now {' > '.join(p['shape'])}")
+        slower = p["execution_ms"] - old["execution_ms"]
+        if slower > NOISE_MS and p["execution_ms"] > old["execution_ms"] * (1 + tolerance):
+            found.append(f"{name}: {old['execution_ms']:.2f} -> {p['execution_ms']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dsn", default=os.environ.get("TALE_BENCH_DSN"),
+                        help="libpq connection string (default: $TALE_BENCH_DSN)")
+    parser.add_argument("--schema", default="tale_bench")
+    parser.add_argument("--size", type=int, default=100000, help="stories to seed")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="EXPLAIN ANALYZE runs per query (median time is kept)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write plan summaries to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed execution time growth (default 0.5)")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("set TALE_BENCH_DSN or pass --dsn")
+
+    con = psycopg2.connect(args.dsn, cursor_factory=RecordingCursor,
+                           options=f"-c search_path={args.schema},public")
+    plans = {}
+    try:
+        rng = random.Random(args.seed)
+        print(f"seeding {args.size:,} stories...", flush=True)
+        seed(con, args.schema, args.size, rng)
+        cases = list(hot_queries(args.size, rng)) + [update_case(con, args.size, rng)]
+        for name, fn, fn_args in cases:
+            plans.update(explain(con, name, fn, fn_args, args.repeat))
+        report(plans)
+    finally:
+        if not args.keep:
+            con.rollback()
+            con.cursor().execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+            con.commit()
+        con.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(plans, f, indent=2)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    found = problems(plans, baseline, args.tolerance)
+    for line in found:
+        print("PLAN", line)
+    sys.exit(1 if found and args.baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
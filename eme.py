@@ -1,153 +1,245 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import date, datetime
-import os
-
-# PostgreSQL configuration - UPDATE THESE CONNECTION DETAILS
-DB_HOST = "localhost"  # or your host
-DB_NAME = "tale_keeper"
-DB_USER = "shane"
-DB_PASSWORD = "xshanex"
-DB_PORT = "5432"
+from tkinter import ttk, messagebox, filedialog
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import sqlite3
+import threading
+import time
+
+from tale_repository import (
+    CHAPTER_PAGE_SIZE, DEFAULT_SHELF, NOTIFY_MAX_IDS, SEARCH_PAGE_SIZE,
+    SIMILAR_TOP_K, SORT_COLUMNS, ChangeListener, ChapterJournal, LocalCache,
+    Story, StoryStore, UpdateConflict, add_to_shelf, bulk_update_stories,
+    close_pool, count_words, db_connection, delete_stories, export_stories,
+    fetch_chapters, fetch_preview, fetch_shelf_page, fetch_story_rows,
+    get_activity_stats, import_stories, init_database, insert_story,
+    is_disconnect, list_shelves, merge_story_values, metrics,
+    open_similarity_index, parse_date, parse_int, query_story_page,
+    record_read, remove_from_shelf, save_chapter, search_story_ids,
+    stream_stories, sync_local_cache, sync_similarity_index, traced_operation,
+    update_story,
+)
+
+# virtual table settings
+TABLE_OVERSCAN = 20        # rows rendered/prefetched beyond the visible window
+ROW_CACHE_SIZE = 2000      # story records kept in memory while scrolling
+PREVIEW_CACHE_SIZE = 50    # full preview texts kept after being opened
+SEARCH_DEBOUNCE_MS = 250   # pause in typing before a live search runs
+SEARCH_CANCEL_AFTER = 1.0  # stale searches running shorter than this finish unread
+UI_POLL_MS = 30            # how often background results are picked up
+
+# table streaming settings
+STREAM_CHUNKS_IN_FLIGHT = 4  # chunks allowed to wait for the Tk thread
+
+RECONNECT_INTERVAL = 30    # seconds between retries while offline
+
+# background DB worker settings
+DB_WORKERS = 3             # threads running DB jobs
+DB_OP_TIMEOUT = 15         # seconds a started UI operation gets before it is abandoned
+
+# chapter editor autosave
+JOURNAL_EVERY_MS = 500         # edits are journaled locally at most this often
+AUTOSAVE_IDLE_MS = 3000        # pause in typing before the draft goes to the DB
+AUTOSAVE_INTERVAL_MS = 30000   # ...and at least this often while typing goes on
+
+# performance panel
+PERF_REFRESH_MS = 1000     # how often the open panel is redrawn
+PERF_PANEL_ROWS = 8        # slowest operations (by p95) listed
+
+# similar stories
+SIMILAR_SAVE_MS = 60000    # changed index is written to disk at most this often
 
 BG_MAIN = "#ffccdd"
 BG_HEADER = "#a7c7ff"
 
-def get_connection():
-    """Get PostgreSQL connection."""
-    return psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        port=DB_PORT
-    )
+# ---------- background DB worker ----------
+class DbJob:
+    """Handle for one background database operation."""
 
-# ---------- streak DB helpers ----------
-def init_streak_table():
-    """Create streak table if it does not exist and ensure one row."""
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS reading_streak (
-            id INTEGER PRIMARY KEY CHECK (id = 1),
-            last_read_date DATE,
-            current_streak INTEGER DEFAULT 0,
-            longest_streak INTEGER DEFAULT 0
-        )
-    """)
-    cur.execute("SELECT COUNT(*) FROM reading_streak")
-    if cur.fetchone()[0] == 0:
-        cur.execute(
-            "INSERT INTO reading_streak (id, last_read_date, current_streak, longest_streak) "
-            "VALUES (1, NULL, 0, 0)"
-        )
-    con.commit()
-    con.close()
-
-def get_streak():
-    """Return (last_read_date, current_streak, longest_streak)."""
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("SELECT last_read_date, current_streak, longest_streak FROM reading_streak WHERE id = 1")
-    row = cur.fetchone()
-    con.close()
-    return row if row else (None, 0, 0)
-
-def update_streak_on_read():
-    """Update streak when user reads a story (called by Read Story button)."""
-    today = date.today()
-    
-    last_read_date, current_streak, longest_streak = get_streak()
-    
-    if last_read_date is None:
-        new_streak = 1
-    else:
-        last = last_read_date  # already date object
-        diff = (today - last).days
-        if diff == 0:
-            messagebox.showinfo("Streak", "Today's read is already counted.")
+    def __init__(self, worker, fn, args, on_done, on_error, timeout):
+        self.worker = worker
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.timeout = timeout
+        self.future = None
+        self.started = None     # time.monotonic() when its query began
+        self.cancelled = False
+        self.reported = False  # touched on the Tk thread only
+        self._con = None
+        self._lock = threading.Lock()
+
+    def cancel(self, query=True):
+        """Drop the job (Tk thread); a running query is cancelled on the server.
+
+        Sending the cancel opens a connection of its own, which can hang
+        when the network has stalled, so it is done from a short-lived
+        thread and never on the Tk thread. With `query=False` a running
+        query is left to finish and only its result is dropped.
+        """
+        with self._lock:
+            self.cancelled = True
+            running = self._con is not None
+        if running and query:
+            threading.Thread(target=self._cancel_query, name="db-cancel",
+                             daemon=True).start()
+        if self.future.cancel():
+            # never started, so no result will come back to settle it
+            self.worker._report(self, None, None)
+
+    def elapsed(self):
+        """Seconds its query has been running (0 before it starts)."""
+        started = self.started
+        return time.monotonic() - started if started is not None else 0.0
+
+    def _cancel_query(self):
+        # holding the lock keeps the connection from going back to the pool
+        with self._lock:
+            if self._con is not None:
+                try:
+                    self._con.cancel()
+                except Exception:
+                    pass  # the job is settled by its result or its timeout
+
+class DbWorker:
+    """Run database jobs on background threads so Tk never waits on psycopg2.
+
+    `submit(fn, *args)` runs `fn(con, *args)` on a pooled connection. The
+    outcome is passed to `on_done(result)` or `on_error(exc)` on the Tk
+    thread via a `root.after` pump. A job still running `timeout` seconds
+    after a worker picked it up is cancelled and reported as a TimeoutError;
+    time spent queued behind other jobs doesn't count. `on_busy(bool)` is told when
+    work starts and when the queue drains; `on_disconnect(exc)` when a job
+    failed because the server could not be reached.
+    """
+
+    def __init__(self, root, workers=DB_WORKERS, on_busy=None, on_disconnect=None):
+        self.root = root
+        self.on_busy = on_busy
+        self.on_disconnect = on_disconnect
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="db")
+        self._calls = queue.Queue()
+        self._pending = 0
+        root.after(UI_POLL_MS, self._pump)
+
+    def submit(self, fn, *args, on_done=None, on_error=None,
+               timeout=DB_OP_TIMEOUT):
+        """Queue `fn(con, *args)`; return its DbJob."""
+        job = DbJob(self, fn, args, on_done, on_error, timeout)
+        self._set_pending(self._pending + 1)
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def call_soon(self, callback, *args):
+        """Schedule `callback(*args)` on the Tk thread; safe from workers."""
+        self._calls.put((callback, args))
+
+    def shutdown(self):
+        """Stop accepting jobs and drop the ones not yet started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        result = error = None
+        ran = False
+        name = job.fn.__name__
+        start = time.perf_counter()
+        if job.timeout:
+            self.call_soon(self._start_clock, job)
+        try:
+            with traced_operation(name), db_connection() as con:
+                # a job cancelled while it waited is skipped, but still
+                # reported below: future.cancel() can no longer settle it
+                with job._lock:
+                    ran = not job.cancelled
+                    if ran:
+                        job._con = con
+                        job.started = time.monotonic()
+                if ran:
+                    try:
+                        result = job.fn(con, *job.args)
+                    finally:
+                        with job._lock:
+                            job._con = None
+        except Exception as e:
+            error = e
+        if ran:
+            rows = len(result) if hasattr(result, "__len__") else None
+            metrics.observe("op", name, (time.perf_counter() - start) * 1000, rows)
+        self.call_soon(self._report, job, result, error)
+
+    def _start_clock(self, job):
+        if not job.reported:
+            self.root.after(int(job.timeout * 1000), lambda: self._expire(job))
+
+    def _expire(self, job):
+        if job.reported:
             return
-        elif diff == 1:
-            new_streak = current_streak + 1
-        else:
-            new_streak = 1
-    
-    new_longest = max(longest_streak, new_streak)
-    
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        UPDATE reading_streak
-        SET last_read_date = %s, current_streak = %s, longest_streak = %s
-        WHERE id = 1
-    """, (today, new_streak, new_longest))
-    con.commit()
-    con.close()
-    
-    streak_lbl.config(text=f"Current streak: {new_streak} day(s)")
-    longest_lbl.config(text=f"Longest streak: {new_longest} day(s)")
-
-# ---------- Story DB helpers ----------
-def init_stories_table():
-    """Create stories table if it does not exist."""
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS stories (
-            id SERIAL PRIMARY KEY,
-            favorite BOOLEAN DEFAULT FALSE,
-            title TEXT NOT NULL,
-            author TEXT,
-            genre TEXT,
-            date_started DATE,
-            date_completed DATE,
-            status TEXT,
-            num_chapters INTEGER DEFAULT 0,
-            word_count INTEGER DEFAULT 0,
-            main_character TEXT,
-            last_updated DATE,
-            preview TEXT DEFAULT ''
-        )
-    """)
-    con.commit()
-    con.close()
+        self._report(job, None, TimeoutError(
+            f"{job.fn.__name__} did not finish within {job.timeout} seconds"))
+        job.cancel()
 
-def load_stories_to_tree():
-    """Load all stories from DB into treeview."""
-    for item in tree.get_children():
-        tree.delete(item)
-    
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        SELECT id, favorite, title, author, genre, date_started, date_completed, 
-               status, num_chapters, word_count, main_character, last_updated, preview
-        FROM stories ORDER BY id
-    """)
-    rows = cur.fetchall()
-    con.close()
-    
-    for row in rows:
-        fav_icon = "★" if row[1] else ""
-        tree.insert("", "end", values=(
-            row[0], fav_icon, row[2], row[3], row[4],
-            row[5] or "", row[6] or "", row[7] or "",
-            row[8] or 0, row[9] or 0, row[10] or "",
-            row[11] or "", row[12] or ""
-        ))
+    def _report(self, job, result, error):
+        if job.reported:
+            return
+        job.reported = True
+        self._set_pending(self._pending - 1)
+        if job.cancelled:
+            return
+        if error is not None and self.on_disconnect is not None and is_disconnect(error):
+            self.on_disconnect(error)
+        if error is not None:
+            if job.on_error is not None:
+                job.on_error(error)
+            else:
+                show_db_error(error)
+        elif job.on_done is not None:
+            # the UI work a result triggers (repaints included)
+            with metrics.timer("callback", job.fn.__name__):
+                job.on_done(result)
 
-def save_story_to_db():
-    """Save current form data as new story."""
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        INSERT INTO stories (favorite, title, author, genre, date_started, date_completed, 
-                           status, num_chapters, word_count, main_character, last_updated)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
+    def _set_pending(self, count):
+        was_busy = self._pending > 0
+        self._pending = count
+        if self.on_busy is not None and was_busy != (count > 0):
+            self.on_busy(count > 0)
+
+    def _pump(self):
+        try:
+            while True:
+                callback, args = self._calls.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self._pump)
+
+def show_db_error(error):
+    """Report a failed background DB operation."""
+    if is_disconnect(error):
+        return  # reported once, by connection_lost
+    messagebox.showerror("Database Error", f"Database operation failed:\n{error}")
+
+# ---------- UI actions backed by the DB worker ----------
+offline = False      # True while PostgreSQL is unreachable: cached, read-only
+local_cache = None   # LocalCache, when the snapshot file could be opened
+
+def require_online():
+    """Warn and return False while running read-only from the cache."""
+    if offline:
+        messagebox.showwarning(
+            "Read-only",
+            "The database is unreachable, so changes are disabled.\n"
+            "You are viewing the local cached copy.")
+        return False
+    return True
+
+def form_values():
+    """Collect the story form in the column order used by insert/update."""
+    return (
         fav_var.get(),
         story_title.get(),
         author_entry.get(),
@@ -159,102 +251,1051 @@ def save_story_to_db():
         int(word_count.get() or 0),
         main_char.get(),
         last_upd.get() or None
-    ))
-    con.commit()
-    con.close()
-    load_stories_to_tree()
-    clear_form()
-    messagebox.showinfo("Success", "Story created!")
+    )
+
+def show_streak(current_streak, longest_streak):
+    """Show streak numbers in the right panel."""
+    streak_lbl.config(text=f"Current streak: {current_streak} day(s)")
+    longest_lbl.config(text=f"Longest streak: {longest_streak} day(s)")
+
+activity_stats = None  # last get_activity_stats() result
+unsaved_words = {}     # chapter draft journal path -> words not yet in the DB
+
+def show_activity(stats):
+    """Show the streak and words-written figures from get_activity_stats."""
+    global activity_stats
+    activity_stats = stats
+    show_streak(stats["current_streak"], stats["longest_streak"])
+    show_progress()
+
+def show_progress():
+    """Show words written, counting drafts still being typed."""
+    if activity_stats is None:
+        return
+    draft = sum(unsaved_words.values())
+    progress_lbl.config(text=f"Words written: {activity_stats['words_written'] + draft:,}")
+    progress_week_lbl.config(
+        text=f"Today: {activity_stats['words_today'] + draft:,} · "
+             f"Last 7 days: {activity_stats['words_week'] + draft:,}")
+
+def refresh_activity():
+    """Re-read the dashboard figures in the background."""
+    db_worker.submit(get_activity_stats, on_done=show_activity)
+
+def update_streak_on_read(story_id):
+    """Log a read of `story_id` and update the streak (Read Story button)."""
+    def counted(result):
+        if result is None:
+            messagebox.showinfo("Streak", "Today's read is already counted.")
+            return
+        refresh_activity()
+    
+    db_worker.submit(record_read, story_id, on_done=counted)
+
+stream_job = stream_stop = None  # the table load currently streaming
+table_shows_all = False  # every story in id order, so new ones belong in it
+
+def cancel_stream():
+    """Stop a table load that is still streaming."""
+    if stream_job is not None:
+        stream_stop.set()
+        stream_job.cancel()
+
+def load_stories_to_tree():
+    """Stream the whole story table in, keeping the current scroll position.
+
+    With a sort order or filter active the table is paged in from the
+    server instead (see show_sorted_view). Offline, the local cache
+    answers in the same order and with the same filters.
+
+    Chunks are applied on the Tk thread as they arrive, so the first
+    screenful shows at once; at most STREAM_CHUNKS_IN_FLIGHT chunks wait
+    in memory before the worker pauses.
+    """
+    global stream_job, stream_stop, table_shows_all
+    cancel_stream()
+    table_shows_all = not table_filters and table_sort == ("ID", False)
+    if offline:
+        sort, descending = table_sort
+        story_view.set_ids(local_cache.story_ids(table_filters, sort, descending),
+                           sorted_by_id=table_shows_all)
+        return
+    if not table_shows_all:
+        show_sorted_view()
+        return
+    generation = story_view.begin_stream()
+    stop = stream_stop = threading.Event()
+    slots = threading.Semaphore(STREAM_CHUNKS_IN_FLIGHT)
+    
+    def deliver(rows):
+        story_view.append_rows(generation, rows)
+        slots.release()
+    
+    def on_chunk(rows):  # runs on the worker thread
+        slots.acquire()
+        if stop.is_set():
+            slots.release()
+            return False
+        db_worker.call_soon(deliver, rows)
+        return True
+    
+    stream_job = db_worker.submit(
+        stream_stories, on_chunk, timeout=None,
+        on_done=lambda result: story_view.end_stream(generation))
+
+def save_story_to_db():
+    """Save current form data as new story."""
+    if not require_online():
+        return
+    def saved(story):
+        if table_shows_all:
+            story_view.insert(story)
+        elif table_filters or table_sort != ("ID", False):
+            # it may not match the filters, or sorts somewhere else
+            load_stories_to_tree()
+        # a search result is left as it is
+        clear_form()
+        messagebox.showinfo("Success", "Story created!")
+    
+    db_worker.submit(insert_story, form_values(), on_done=saved)
 
 def update_story_in_db():
-    """Update selected story with form data."""
-    sel = tree.selection()
-    if not sel:
+    """Update selected story with form data.
+
+    The save only applies over the version the form was loaded from. If
+    someone else saved the story meanwhile, their changes are merged
+    with the form's field by field; fields both sides changed are put to
+    the user.
+    """
+    if not require_online():
+        return
+    story_id = story_view.current()
+    if story_id is None:
         messagebox.showwarning("Update", "Please select a story to update.")
         return
+    base = form_base if form_base is not None and form_base.id == story_id \
+        else story_view.story(story_id)
+    if base is None:
+        return  # row still loading
     
-    story_id = tree.item(sel[0], "values")[0]
+    def updated(story):
+        if story is None:
+            story_view.remove(story_id)
+            clear_form()
+            messagebox.showwarning("Update", "This story no longer exists.")
+            return
+        story_view.update(story)
+        fill_form(story)
+        messagebox.showinfo("Success", "Story updated!")
     
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        UPDATE stories 
-        SET favorite = %s, title = %s, author = %s, genre = %s, 
-            date_started = %s, date_completed = %s, status = %s,
-            num_chapters = %s, word_count = %s, main_character = %s, last_updated = %s
-        WHERE id = %s
-    """, (
-        fav_var.get(),
-        story_title.get(),
-        author_entry.get(),
-        genre_var.get(),
-        date_started.get() or None,
-        date_completed.get() or None,
-        status_var.get(),
-        int(num_chaps.get() or 0),
-        int(word_count.get() or 0),
-        main_char.get(),
-        last_upd.get() or None,
-        story_id
-    ))
-    con.commit()
-    con.close()
-    load_stories_to_tree()
-    messagebox.showinfo("Success", "Story updated!")
+    def conflicted(error):
+        nonlocal base
+        if not isinstance(error, UpdateConflict):
+            show_db_error(error)
+            return
+        theirs = error.current
+        story_view.update(theirs)
+        merged, clashes = merge_story_values(base, form_values(), theirs)
+        base = theirs
+        if clashes:
+            answer = messagebox.askyesnocancel(
+                "Update Conflict",
+                "Someone else saved this story while you were editing it.\n"
+                f"You both changed: {', '.join(clashes)}.\n\n"
+                "Yes - save your values for those fields\n"
+                "No - discard your edits and load their version\n"
+                "Cancel - keep editing (their other changes are merged in)")
+            if answer is False:
+                fill_form(theirs)
+                return
+            fill_form(Story(story_id, *merged, preview=theirs.preview, version=theirs.version))
+            if answer is None:
+                return
+        save(merged, theirs.version)
+    
+    def save(values, version):
+        db_worker.submit(update_story, story_id, values, version,
+                         on_done=updated, on_error=conflicted)
+    
+    save(form_values(), base.version)
 
 def delete_story_from_db():
-    """Delete selected story."""
-    sel = tree.selection()
-    if not sel:
+    """Delete every selected story in one transaction."""
+    if not require_online():
+        return
+    story_ids = story_view.selection()
+    if not story_ids:
         messagebox.showwarning("Delete", "Please select a story to delete.")
         return
     
-    if not messagebox.askyesno("Confirm Delete", "Delete this story?"):
+    prompt = ("Delete this story?" if len(story_ids) == 1
+              else f"Delete these {len(story_ids)} stories?")
+    if not messagebox.askyesno("Confirm Delete", prompt):
         return
     
-    story_id = tree.item(sel[0], "values")[0]
+    def deleted(result):
+        story_view.remove_many(story_ids)
+        clear_form()
     
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("DELETE FROM stories WHERE id = %s", (story_id,))
-    con.commit()
-    con.close()
-    load_stories_to_tree()
-    clear_form()
+    db_worker.submit(delete_stories, story_ids, on_done=deleted)
 
-def search_stories():
-    """Search stories by title or author."""
-    search_term = story_title.get().lower()
-    if not search_term:
+def show_bulk_result(story_ids, stories):
+    """Refresh the rows a bulk update returned; drop ones deleted meanwhile."""
+    story_view.update_many(stories)
+    story_view.remove_many(set(story_ids) - {story.id for story in stories})
+
+def bulk_edit_stories():
+    """Set favorite, status and/or genre on every selected story at once."""
+    if not require_online():
+        return
+    story_ids = story_view.selection()
+    if not story_ids:
+        messagebox.showwarning("Bulk Edit", "Please select the stories to change.")
+        return
+    
+    win = tk.Toplevel(root)
+    win.title(f"Bulk Edit ({len(story_ids)} stories)")
+    win.geometry("320x190")
+    win.transient(root)
+    tk.Label(win, text="Blank fields are left unchanged.",
+             font=("Monotype Corsiva", 11)).grid(row=0, column=0, columnspan=2, pady=6)
+    
+    choices = {}
+    fields = (("Favorite:", "favorite", ["", "Yes", "No"]),
+              ("Status:", "status", [""] + list(status_combo["values"])),
+              ("Genre:", "genre", [""] + list(genre_combo["values"])))
+    for row, (label, column, values) in enumerate(fields, 1):
+        tk.Label(win, text=label, font=("Monotype Corsiva", 11)).grid(
+            row=row, column=0, sticky="w", padx=10, pady=2)
+        var = tk.StringVar()
+        ttk.Combobox(win, textvariable=var, values=values, width=18,
+                     state="readonly").grid(row=row, column=1, padx=10, pady=2)
+        choices[column] = var
+    
+    def updated(stories):
+        show_bulk_result(story_ids, stories)
+        if win.winfo_exists():
+            win.destroy()
+        messagebox.showinfo("Bulk Edit", f"Updated {len(stories)} stories.")
+    
+    def apply():
+        changes = {column: var.get() for column, var in choices.items() if var.get()}
+        if "favorite" in changes:
+            changes["favorite"] = changes["favorite"] == "Yes"
+        if not changes:
+            messagebox.showwarning("Bulk Edit", "Choose at least one change.", parent=win)
+            return
+        db_worker.submit(bulk_update_stories, story_ids, changes, on_done=updated)
+    
+    tk.Button(win, text="Apply", width=12, command=apply, bg=BG_MAIN,
+              font=("Monotype Corsiva", 10)).grid(row=4, column=0, columnspan=2, pady=8)
+
+def apply_remote_changes(changes):
+    """Apply story/streak changes announced by other instances (or this one).
+
+    Only the changed rows are re-read; a notification without ids (a bulk
+    statement) reloads the table instead.
+    """
+    if offline:
+        return
+    changed, deleted = set(), set()
+    reload = streak = False
+    for change in changes:
+        if change.get("table") == "reading_streak":
+            streak = True
+        elif change.get("ids") is None:
+            reload = True
+        elif change.get("op") == "DELETE":
+            deleted.update(change["ids"])
+            changed.difference_update(change["ids"])
+        else:
+            changed.update(change["ids"])
+            deleted.difference_update(change["ids"])
+    
+    if streak:
+        refresh_activity()
+    if reload or changed or deleted:
+        refresh_similar()
+    if reload:
+        # a search result is left alone; anything else is re-read
+        if table_shows_all or table_filters or table_sort != ("ID", False):
+            load_stories_to_tree()
+        return
+    for story_id in changed | deleted:
+        preview_cache.pop(story_id, None)
+    story_view.remove_many(deleted)
+    if not changed:
+        return
+    
+    def arrived(rows):
+        for story in rows.values():
+            # a streaming load will deliver rows it hasn't reached yet itself
+            if table_shows_all and not story_view.streaming:
+                story_view.insert(story)
+            else:
+                story_view.update(story)
+        story_view.remove_many(changed - set(rows))
+    
+    db_worker.submit(fetch_story_rows, changed, on_done=arrived)
+
+# ---------- full previews ----------
+# list rows only carry a snippet; the whole text is fetched when a story is
+# opened and the most recent ones are kept here (least recently used first)
+preview_cache = OrderedDict()
+
+def load_preview(story_id, on_done):
+    """Pass the full preview of a story to on_done (cached, or fetched)."""
+    if story_id in preview_cache:
+        preview_cache.move_to_end(story_id)
+        on_done(preview_cache[story_id])
+        return
+    if offline:
+        # the local cache only keeps the snippet
+        story = story_view.story(story_id)
+        on_done(story.preview or "" if story else "")
+        return
+    
+    def fetched(text):
+        if text is None:
+            return  # deleted meanwhile
+        preview_cache[story_id] = text
+        while len(preview_cache) > PREVIEW_CACHE_SIZE:
+            preview_cache.popitem(last=False)
+        on_done(text)
+    
+    db_worker.submit(fetch_preview, story_id, on_done=fetched)
+
+# ---------- similar stories ----------
+similar_index = None  # SimilarityIndex (None without NumPy)
+similar_job = None    # sync in flight
+similar_stale = False # changes announced while it ran
+similar_save = None   # pending timed save of the index file
+
+def refresh_similar():
+    """Fold story changes into the similar-stories index in the background."""
+    global similar_job, similar_stale
+    if similar_index is None or offline:
+        return
+    if similar_job is not None:
+        similar_stale = True
+        return
+    
+    def finished(changed=0):
+        global similar_job, similar_stale, similar_save
+        similar_job = None
+        if changed and similar_save is None:
+            similar_save = root.after(SIMILAR_SAVE_MS, save_similar)
+        if similar_stale:
+            similar_stale = False
+            refresh_similar()
+    
+    def failed(error):
+        mode_lbl.config(text=f"Similar stories not updated: {error}")
+        finished()
+    
+    # a first build can take a while, so it never holds up the UI's workers
+    similar_job = similar_worker.submit(sync_similarity_index, similar_index, timeout=None,
+                                        on_done=finished, on_error=failed)
+
+def save_similar():
+    """Write the changed index to disk off the Tk thread."""
+    global similar_save
+    similar_save = None
+    threading.Thread(target=similar_index.save, name="similar-save", daemon=True).start()
+
+def load_similar(story_id, on_done):
+    """Pass the Story records most like `story_id` to on_done, best first.
+
+    Neighbours come from the in-memory index; only rows missing from the
+    row store are fetched.
+    """
+    if similar_index is None:
+        return
+    ids = [i for i, _ in similar_index.similar(story_id, SIMILAR_TOP_K)]
+    known = {i: story_store.get(i) for i in ids if i in story_store}
+    missing = [i for i in ids if i not in known]
+    if not missing:
+        on_done([known[i] for i in ids])
+        return
+    
+    def arrived(rows):
+        if rows is not None:
+            known.update(rows)
+            on_done([known[i] for i in ids if i in known])
+    
+    fetch_rows_in_background(missing, arrived)
+
+def similar_text(stories, sep):
+    """Format similar stories as "Title (Author)" entries."""
+    return sep.join(f"{s.title} ({s.author})" if s.author else s.title for s in stories)
+
+def start_story_search(term, on_done):
+    """Run a story search in the background (or on the cache when offline)."""
+    if offline:
+        on_done(local_cache.search_ids(term))
+        return None
+    return db_worker.submit(search_story_ids, term, on_done=on_done)
+
+def show_search_results(term, ids):
+    """Put a search result (or the full table for an empty term) on screen."""
+    global table_shows_all
+    if not term:
         load_stories_to_tree()
         return
+    cancel_stream()
+    table_shows_all = False
+    if offline:
+        story_view.set_ids(ids, reset=True)  # the cache returns every match
+        return
+    # further pages are fetched when the user scrolls to the end
+    def more(loaded, done):
+        def failed(error):
+            done(None)
+            show_db_error(error)
+        db_worker.submit(search_story_ids, term, SEARCH_PAGE_SIZE, loaded,
+                         on_done=done, on_error=failed)
+    story_view.set_ids(ids, reset=True, sorted_by_id=False, more=more)
+
+def search_stories():
+    """Search stories by title, author, character, genre or preview."""
+    live_search.search_now(story_title.get())
+
+# ---------- server-side sort / filter ----------
+table_sort = ("ID", False)  # (column, descending)
+table_filters = {}
+
+def show_sorted_view():
+    """Page the table in from the server in the current sort/filter order."""
+    cancel_stream()
+    sort, descending = table_sort
+    filters = dict(table_filters)
+    last_key = [None]
+    
+    def page(after, done):
+        def arrived(result):
+            ids, last_key[0] = result
+            done(ids)
+        def failed(error):
+            done(None)
+            show_db_error(error)
+        db_worker.submit(query_story_page, filters, sort, descending, after,
+                         on_done=arrived, on_error=failed)
+    
+    def more(loaded, done):
+        page(last_key[0], done)
+    
+    def first(ids):
+        if ids is not None:
+            story_view.set_ids(ids, reset=True, sorted_by_id=False, more=more)
+    
+    page(None, first)
+
+def show_sort_arrows():
+    """Mark the sorted column's heading (nothing for the default id order)."""
+    sort, descending = table_sort
+    for col in columns:
+        arrow = ""
+        if col == sort and table_sort != ("ID", False):
+            arrow = " ▼" if descending else " ▲"
+        tree.heading(col, text=col + arrow)
+
+def sort_by(column):
+    """Header click: sort by `column`, toggling direction on a repeat click."""
+    global table_sort
+    sort, descending = table_sort
+    table_sort = (column, not descending if column == sort else False)
+    show_sort_arrows()
+    load_stories_to_tree()
+
+def read_filters():
+    """Collect the filter bar into a dict for build_story_query."""
+    filters = {}
+    if filter_genre_var.get():
+        filters["genre"] = filter_genre_var.get()
+    if filter_status_var.get():
+        filters["status"] = filter_status_var.get()
+    if filter_fav_var.get():
+        filters["favorite"] = True
+    for key, entry, parse in (("started_from", started_from_entry, parse_date),
+                              ("started_to", started_to_entry, parse_date),
+                              ("words_min", words_min_entry, parse_int),
+                              ("words_max", words_max_entry, parse_int)):
+        text = entry.get().strip()
+        if text:
+            filters[key] = parse(text)
+    return filters
+
+def apply_filters():
+    """Filter the table on the server using the filter bar."""
+    global table_filters
+    try:
+        table_filters = read_filters()
+    except ValueError as e:
+        messagebox.showwarning("Filter", f"Invalid filter value: {e}\n"
+                               "Dates are YYYY-MM-DD, word counts whole numbers.")
+        return
+    load_stories_to_tree()
+
+def reset_filters():
+    """Clear the filter bar and the sort order."""
+    global table_filters, table_sort
+    filter_genre_var.set("")
+    filter_status_var.set("")
+    filter_fav_var.set(False)
+    for e in (started_from_entry, started_to_entry, words_min_entry, words_max_entry):
+        e.delete(0, tk.END)
+    table_filters = {}
+    table_sort = ("ID", False)
+    show_sort_arrows()
+    load_stories_to_tree()
+
+def run_transfer(title, fn, path, on_finished):
+    """Run an import/export job with a progress window and a Cancel button."""
+    win = tk.Toplevel(root)
+    win.title(title)
+    win.geometry("360x120")
+    win.transient(root)
+    status = tk.Label(win, text=f"{title}: starting...", font=("Monotype Corsiva", 11))
+    status.pack(pady=8)
+    bar = ttk.Progressbar(win, mode="determinate", maximum=1.0, length=300)
+    bar.pack(pady=4)
+    stop = threading.Event()
+    tk.Button(win, text="Cancel", command=stop.set).pack(pady=4)
+    
+    def show_progress(fraction, rows):
+        if win.winfo_exists():
+            bar["value"] = fraction
+            status.config(text=f"{title}: {rows:,} stories")
+    
+    def on_progress(fraction, rows):  # runs on the worker thread
+        db_worker.call_soon(show_progress, fraction, rows)
+    
+    def finished(result):
+        win.destroy()
+        on_finished(result)
+    
+    def failed(error):
+        win.destroy()
+        if stop.is_set():
+            messagebox.showinfo(title, f"{title} cancelled; nothing was changed.")
+        else:
+            show_db_error(error)
+    
+    db_worker.submit(fn, path, on_progress, stop, timeout=None,
+                     on_done=finished, on_error=failed)
+
+def import_stories_from_file():
+    """Ask for a CSV/JSONL file and bulk-import its stories."""
+    if not require_online():
+        return
+    path = filedialog.askopenfilename(
+        title="Import stories",
+        filetypes=[("CSV or JSON Lines", "*.csv *.jsonl *.json"), ("All files", "*")])
+    if not path:
+        return
     
-    for item in tree.get_children():
-        tree.delete(item)
-    
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("""
-        SELECT id, favorite, title, author, genre, date_started, date_completed, 
-               status, num_chapters, word_count, main_character, last_updated, preview
-        FROM stories 
-        WHERE LOWER(title) LIKE %s OR LOWER(author) LIKE %s
-        ORDER BY id
-    """, (f'%{search_term}%', f'%{search_term}%'))
-    rows = cur.fetchall()
-    con.close()
-    
-    for row in rows:
-        fav_icon = "★" if row[1] else ""
-        tree.insert("", "end", values=(
-            row[0], fav_icon, row[2], row[3], row[4],
-            row[5] or "", row[6] or "", row[7] or "",
-            row[8] or 0, row[9] or 0, row[10] or "",
-            row[11] or "", row[12] or ""
-        ))
-
-# ---------- global library list (in‑memory for now) ----------
-library_stories = []
+    def imported(result):
+        count, errors = result
+        message = f"Imported {count:,} stories."
+        if errors:
+            shown = "\n".join(f"line {line}: {err}" for line, err in errors[:10])
+            message += f"\n\nSkipped {len(errors):,} invalid records:\n{shown}"
+        messagebox.showinfo("Import", message)
+        load_stories_to_tree()
+    
+    run_transfer("Import", import_stories, path, imported)
+
+def export_stories_to_file():
+    """Ask for a target file and export every story to CSV/JSONL."""
+    if not require_online():
+        return
+    path = filedialog.asksaveasfilename(
+        title="Export stories", defaultextension=".csv",
+        filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+    if not path:
+        return
+    run_transfer("Export", export_stories, path,
+                 lambda count: messagebox.showinfo("Export", f"Exported {count:,} stories."))
+
+def fetch_rows_in_background(ids, done):
+    """Row source for the story table: the DB worker, or the cache offline."""
+    if offline:
+        done(local_cache.fetch_rows(ids))
+        return
+    def failed(error):
+        done(None)
+        show_db_error(error)
+    db_worker.submit(fetch_story_rows, ids, on_done=done, on_error=failed)
+
+# ---------- virtual table ----------
+class VirtualTreeview:
+    """Show a large result set in a ttk.Treeview without inserting every row.
+
+    The view keeps only the ordered story ids of the current result set.
+    Just the visible window (plus `overscan` rows) exists as Treeview items;
+    their Story records live in the shared, bounded `store`, so scrolling
+    and refreshing cost the same for 100 or 1M stories. Missing rows are
+    asked for with `fetch_rows(ids, done)`, which must call
+    `done({id: Story})` later on the Tk thread (`done(None)` if the fetch
+    failed); until then the rows show as placeholders. `row_values(story)`
+    picks the tuple shown for a row (all table columns by default).
+    Items use the story id as their iid; renders are timed under `name`.
+    """
+
+    def __init__(self, tree, scrollbar, fetch_rows, store, overscan=TABLE_OVERSCAN,
+                 row_values=None, name="table"):
+        self.tree = tree
+        self.name = name
+        self.scrollbar = scrollbar
+        self.fetch_rows = fetch_rows
+        self.store = store
+        self.row_values = row_values or (lambda story: story.table_values())
+        self.overscan = overscan
+        self.ids = array("q")
+        self.sorted_by_id = True
+        self._more = None
+        self.offset = 0
+        self._visible = int(tree.cget("height"))
+        self._loading = set()
+        self._generation = 0
+        self._streaming = False
+        self._held = []            # inserts waiting for a stream to finish
+        self._more_pending = False
+        self._selected = set()
+        self._extend = False
+        self._render_pending = False
+
+        scrollbar.configure(command=self.yview)
+        tree.configure(yscrollcommand=self._on_tree_scroll)
+        tree.bind("<MouseWheel>", self._on_wheel)
+        tree.bind("<Button-4>", self._on_wheel)
+        tree.bind("<Button-5>", self._on_wheel)
+        tree.bind("<ButtonPress-1>", self._note_modifiers, add="+")
+        tree.bind("<KeyPress>", self._note_modifiers, add="+")
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        tree.bind("<Configure>", lambda e: self.schedule_render(), add="+")
+
+    # -- result set --
+    def set_ids(self, ids, reset=False, sorted_by_id=True, more=None):
+        """Show a new ordered list of story ids.
+
+        `sorted_by_id` tells row-level inserts and removals that they can
+        bisect the id list instead of scanning it. `more(loaded, done)`, if
+        given, fetches the next page of a paginated result set and passes
+        it to `done(ids)` (empty when exhausted); it is called as the user
+        scrolls near the end.
+        """
+        self.ids = ids if isinstance(ids, array) else array("q", ids)
+        self.sorted_by_id = sorted_by_id
+        self._more = more
+        self._more_pending = False
+        self._generation += 1
+        self._streaming = False
+        self._held = []
+        if reset:
+            self.offset = 0
+        if self._selected:
+            present = set(self.ids)
+            self._selected &= present
+        self.render()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # -- streamed result sets --
+    def begin_stream(self):
+        """Start a result set whose rows arrive through append_rows().
+
+        The scroll position and selection are kept so a refresh doesn't
+        jump; returns a token that later chunks must present.
+        """
+        self.ids = array("q")
+        self.sorted_by_id = True
+        self._more = None
+        self._more_pending = False
+        self._generation += 1
+        self._streaming = True
+        return self._generation
+
+    def append_rows(self, generation, rows):
+        """Add a streamed chunk; only rows near the visible window are kept."""
+        if generation != self._generation:
+            return
+        start = len(self.ids)
+        self.ids.extend(story.id for story in rows)
+        low = self.offset - self.overscan
+        high = self.offset + self._visible + 2 * self.overscan
+        for pos, story in enumerate(rows, start):
+            if low <= pos < high or story.id in self._selected:
+                self.store.put(story)
+        if start < high:
+            self.schedule_render()
+        else:
+            self._update_scrollbar()
+
+    @property
+    def streaming(self):
+        """True while a streamed result set is still arriving."""
+        return self._streaming
+
+    def end_stream(self, generation):
+        """Mark a streamed result set as complete."""
+        if generation == self._generation:
+            self._streaming = False
+            held, self._held = self._held, []
+            for story in held:
+                self.insert(story)
+            self.schedule_render()
+
+    # -- row-level changes --
+    def insert(self, story):
+        """Add a newly created story to the result set and show it.
+
+        While a stream is arriving the insert waits for end_stream():
+        chunks still to come are appended after it, and a bisect into the
+        half-loaded ids would leave them out of order.
+        """
+        if self._streaming:
+            self._held.append(story)
+            return
+        story_id = story.id
+        if self.sorted_by_id:
+            pos = bisect_left(self.ids, story_id)
+            if pos < len(self.ids) and self.ids[pos] == story_id:
+                return self.update(story)
+            self.ids.insert(pos, story_id)
+        elif story_id in self.store or story_id in self.ids:
+            return self.update(story)
+        else:
+            self.ids.append(story_id)
+        self.store.put(story)
+        self.schedule_render()
+
+    def update(self, story):
+        """Refresh one story's row in place if it is stored or on screen."""
+        self.store.put(story)
+        iid = str(story.id)
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=self.row_values(story))
+
+    def remove(self, story_id):
+        """Drop one story from the result set."""
+        if self.sorted_by_id:
+            pos = bisect_left(self.ids, story_id)
+            if pos < len(self.ids) and self.ids[pos] == story_id:
+                del self.ids[pos]
+        else:
+            try:
+                self.ids.remove(story_id)
+            except ValueError:
+                pass
+        self.store.discard(story_id)
+        self._selected.discard(story_id)
+        iid = str(story_id)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+        self.schedule_render()
+
+    def update_many(self, stories):
+        """Refresh several rows in place."""
+        for story in stories:
+            self.update(story)
+
+    def remove_many(self, story_ids):
+        """Drop several stories from the result set in one pass."""
+        gone = set(story_ids)
+        if not gone:
+            return
+        self.ids = array("q", (i for i in self.ids if i not in gone))
+        for story_id in gone:
+            self.store.discard(story_id)
+            iid = str(story_id)
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        self._selected -= gone
+        self.schedule_render()
+
+    # -- selection --
+    def selection(self):
+        """Return the selected story ids, including rows scrolled out of view."""
+        return sorted(self._selected)
+
+    def current(self):
+        """Return the focused selected story id, or None."""
+        focus = self.tree.focus()
+        if focus and int(focus) in self._selected:
+            return int(focus)
+        return min(self._selected) if self._selected else None
+
+    def story(self, story_id):
+        """Return the stored Story for a row, or None while it is loading."""
+        return self.store.get(story_id)
+
+    def _note_modifiers(self, event):
+        # Shift (0x1) or Control (0x4) extend the selection; anything else
+        # replaces it, including rows that are currently scrolled away.
+        self._extend = bool(event.state & 0x0005)
+
+    def _on_select(self, event=None):
+        current = {int(iid) for iid in self.tree.selection()}
+        if current and not self._extend:
+            self._selected = current
+            return
+        rendered = {int(iid) for iid in self.tree.get_children()}
+        offscreen = {i for i in self._selected if i not in rendered}
+        self._selected = offscreen | current
+
+    # -- scrolling --
+    def yview(self, *args):
+        """Scrollbar command: handles 'moveto' and 'scroll' requests."""
+        total = len(self.ids)
+        if not total:
+            return
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self._visible
+            self.offset += step
+        self.schedule_render()
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        else:
+            step = -3 if event.delta > 0 else 3
+        self.yview("scroll", step, "units")
+        return "break"
+
+    def _on_tree_scroll(self, first, last):
+        # The treeview only scrolls on its own when keyboard navigation moves
+        # past the rendered rows; translate that into a new window offset.
+        first, last = float(first), float(last)
+        rendered = len(self.tree.get_children())
+        if rendered:
+            if last < 1.0:
+                self._visible = max(1, round((last - first) * rendered))
+            shift = round(first * rendered)
+            if shift:
+                self.offset += shift
+                self.tree.yview_moveto(0)
+                self.schedule_render()
+            elif last >= 1.0 and self.offset + rendered < len(self.ids):
+                # the widget is taller than what was rendered
+                self._visible = max(self._visible, rendered)
+                self.schedule_render()
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.ids)
+        if not total:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.offset / total
+        last = min(1.0, (self.offset + self._visible) / total)
+        self.scrollbar.set(first, last)
+
+    # -- rendering --
+    def _ensure_cached(self, ids):
+        missing = [i for i in ids
+                   if i not in self.store and i not in self._loading]
+        if missing:
+            self._loading.update(missing)
+            self.fetch_rows(missing,
+                            lambda rows: self._rows_arrived(missing, rows))
+        self.store.touch(ids)
+        # selected rows stay stored so handlers can always read them
+        self.store.trim(keep=self._selected)
+
+    def _rows_arrived(self, requested, rows):
+        self._loading.difference_update(requested)
+        if rows is None:
+            return  # fetch failed; the rows are asked for again next render
+        for story in rows.values():
+            # a row-level update that landed meanwhile is newer; keep it
+            self.store.setdefault(story)
+        for story_id in requested:
+            if story_id not in rows:
+                self.remove(story_id)  # deleted since the id list was read
+        self.store.trim(keep=self._selected)
+        self.schedule_render()
+
+    def _more_arrived(self, generation, page):
+        if generation != self._generation:
+            return  # a newer result set replaced this one
+        self._more_pending = False
+        if page:  # None (failed) or empty ends the result set
+            self.ids.extend(page)
+        else:
+            self._more = None
+        self.schedule_render()
+
+    def schedule_render(self):
+        """Coalesce several render requests into one idle callback."""
+        if not self._render_pending:
+            self._render_pending = True
+            self.tree.after_idle(self.render)
+
+    def render(self):
+        """Rebuild the treeview items for the current window."""
+        with metrics.timer("render", self.name, rows=lambda: len(self.tree.get_children())):
+            self._render()
+
+    def _render(self):
+        self._render_pending = False
+        total = len(self.ids)
+        if not self._streaming:
+            # while streaming, hold the position until its rows arrive
+            self.offset = min(self.offset, total - self._visible)
+        self.offset = max(0, self.offset)
+        count = self._visible + self.overscan
+        start = max(0, self.offset - self.overscan)
+        stop = self.offset + count + self.overscan
+        if self._more is not None and not self._more_pending and stop >= total:
+            self._more_pending = True
+            generation = self._generation
+            self._more(total, lambda page: self._more_arrived(generation, page))
+        self._ensure_cached(list(self.ids[start:stop]))
+
+        window = list(self.ids[self.offset:self.offset + count])
+        wanted = {str(i) for i in window}
+        stale = [iid for iid in self.tree.get_children() if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+        for index, story_id in enumerate(window):
+            iid = str(story_id)
+            story = self.store.get(story_id)
+            values = self.row_values(story) if story else (story_id, "", "…")
+            if self.tree.exists(iid):
+                self.tree.move(iid, "", index)
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert("", index, iid=iid, values=values)
+
+        selected = [str(i) for i in window if i in self._selected]
+        if set(selected) != set(self.tree.selection()):
+            self.tree.selection_set(selected)
+        self.tree.yview_moveto(0)
+        self._update_scrollbar()
+
+# ---------- live search ----------
+class LiveSearch:
+    """Search-as-you-type for an entry, off the Tk main loop.
+
+    Keystrokes are debounced and handed to `start_search(term, on_done)`,
+    which runs the query in the background and returns a DbJob (or None
+    if it answered synchronously). A query made stale by newer input is
+    dropped; it is only cancelled on the server once it has run for
+    SEARCH_CANCEL_AFTER, since each cancel costs a connection of its own.
+    Only the latest result reaches `on_results(term, ids)` on the Tk thread.
+    """
+
+    def __init__(self, root, entry, start_search, on_results, enabled=lambda: True):
+        self.root = root
+        self.entry = entry
+        self.start_search = start_search
+        self.on_results = on_results
+        self.enabled = enabled
+        self._after_id = None
+        self._last_term = None
+        self._job = None
+        entry.bind("<KeyRelease>", self._on_key, add="+")
+
+    def _on_key(self, event):
+        if not self.enabled():
+            return
+        term = self.entry.get().strip()
+        if term == self._last_term:
+            return
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._after_id = self.root.after(SEARCH_DEBOUNCE_MS,
+                                         lambda: self.search_now(term))
+
+    def search_now(self, term):
+        """Start a search immediately, superseding any search in flight."""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        term = term.strip()
+        self._last_term = term
+        if self._job is not None:
+            self._job.cancel(query=self._job.elapsed() > SEARCH_CANCEL_AFTER)
+            self._job = None
+        if not term:
+            self.on_results(term, None)
+            return
+        self._job = self.start_search(
+            term, lambda ids: self.on_results(term, ids))
+
+# ---------- live text statistics ----------
+class TextStats:
+    """Running word count of a tk.Text, kept current edit by edit.
+
+    The widget's Tcl command is wrapped so every insert, delete and replace
+    is seen with its indices. A word never spans a newline, so only the
+    lines an edit touches are counted, before and after it: typing in a
+    100k-word chapter costs one paragraph, not a re-split of the text.
+    `on_change(words)` is called from <<Modified>> when the count moved.
+    """
+
+    def __init__(self, text, on_change=None):
+        self.text = text
+        self.on_change = on_change
+        self.words = count_words(text.get("1.0", "end-1c"))
+        self._reported = self.words
+        self._orig = text._w + "_stats"
+        text.tk.call("rename", text._w, self._orig)
+        text.tk.createcommand(text._w, self._proxy)
+        # dropped with the widget, like commands made by register()
+        if text._tclCommands is None:
+            text._tclCommands = []
+        text._tclCommands.append(text._w)
+        text.bind("<<Modified>>", self._modified, add="+")
+
+    def _call(self, *args):
+        return self.text.tk.call(self._orig, *args)
+
+    def _line(self, index):
+        # "end" is past the last line; edits there land on the last line
+        line = int(str(self._call("index", index)).split(".")[0])
+        return min(line, int(str(self._call("index", "end - 1c")).split(".")[0]))
+
+    def _count_lines(self, first, last):
+        return count_words(self._call("get", f"{first}.0", f"{last}.end"))
+
+    def _proxy(self, command, *args):
+        if command not in ("insert", "delete", "replace") or not args:
+            return self._call(command, *args)
+        if command == "delete" and len(args) > 2:
+            # several ranges at once: rare enough to just recount
+            result = self._call(command, *args)
+            self.words = count_words(self._call("get", "1.0", "end - 1c"))
+            return result
+        first = self._line(args[0])
+        if command == "insert":
+            last, added = first, "".join(args[1::2])  # index chars ?tags chars tags...?
+        else:
+            # a lone index deletes one character, which may be a newline
+            # joining the next line onto this one
+            last = self._line(args[1] if len(args) > 1 else f"{args[0]} + 1c")
+            added = "".join(args[2::2]) if command == "replace" else ""
+        before = self._count_lines(first, last)
+        result = self._call(command, *args)
+        self.words += self._count_lines(first, first + added.count("\n")) - before
+        return result
+
+    def _modified(self, event):
+        if self.words != self._reported:
+            self._reported = self.words
+            if self.on_change is not None:
+                self.on_change(self.words)
+
+# ---------- library ----------
+active_shelf = DEFAULT_SHELF  # shelf "Add to Library" puts stories on
 
 # ---------- main window ----------
 root = tk.Tk()
@@ -262,6 +1303,20 @@ root.title("Writers Haven - Story Shelf Record System (PostgreSQL)")
 root.geometry("1100x600")
 root.configure(bg=BG_MAIN)
 
+def set_busy(busy):
+    """Show the busy indicator while DB work is in flight."""
+    if busy:
+        busy_bar.pack(side="right", padx=3)
+        busy_bar.start(15)
+        root.config(cursor="watch")
+    else:
+        busy_bar.stop()
+        busy_bar.pack_forget()
+        root.config(cursor="")
+
+db_worker = DbWorker(root, on_busy=set_busy)
+similar_worker = DbWorker(root, workers=1)  # similar-stories index syncs
+
 # Title label
 title_lbl = tk.Label(root, text="Writers Haven",
                      font=("Monotype Corsiva", 24, "bold"),
@@ -317,7 +1372,19 @@ word_count = add_row(2, 2, "Word Count:")
 main_char  = add_row(3, 0, "Main Character:")
 last_upd   = add_row(3, 2, "Last Updated:")
 
-# ---------- right panel (favorite, streak, progress) ----------
+tk.Label(form_frame, text="Preview:", bg=BG_MAIN,
+         font=("Monotype Corsiva", 11)).grid(row=4, column=0, sticky="nw", padx=3, pady=2)
+preview_lbl = tk.Label(form_frame, text="", bg=BG_MAIN, anchor="w", justify="left",
+                       wraplength=600, font=("Monotype Corsiva", 10, "italic"))
+preview_lbl.grid(row=4, column=1, columnspan=5, sticky="w", padx=3, pady=2)
+
+tk.Label(form_frame, text="Similar:", bg=BG_MAIN,
+         font=("Monotype Corsiva", 11)).grid(row=5, column=0, sticky="nw", padx=3, pady=2)
+similar_lbl = tk.Label(form_frame, text="", bg=BG_MAIN, anchor="w", justify="left",
+                       wraplength=600, font=("Monotype Corsiva", 10))
+similar_lbl.grid(row=5, column=1, columnspan=5, sticky="w", padx=3, pady=2)
+
+# ---------- right panel (favorite, streak, progress, performance) ----------
 right_frame = tk.Frame(top_row, bg=BG_MAIN, bd=2, relief="groove")
 right_frame.pack(side="right", fill="y", padx=(10, 0))
 
@@ -327,20 +1394,16 @@ fav_frame = tk.LabelFrame(right_frame, text="Favorite Story",
 fav_frame.pack(fill="x", padx=5, pady=5)
 
 def toggle_favorite():
-    """When checkbox is clicked, update Fav column for selected row."""
-    sel = tree.selection()
-    if not sel:
+    """When checkbox is clicked, update Fav column for every selected row."""
+    story_ids = story_view.selection()
+    if not story_ids:
+        return
+    if not require_online():
+        fav_var.set(not fav_var.get())
         return
-    story_id = tree.item(sel[0], "values")[0]
-    
-    con = get_connection()
-    cur = con.cursor()
-    cur.execute("UPDATE stories SET favorite = %s WHERE id = %s", 
-                (fav_var.get(), story_id))
-    con.commit()
-    con.close()
     
-    load_stories_to_tree()
+    db_worker.submit(bulk_update_stories, story_ids, {"favorite": fav_var.get()},
+                     on_done=lambda stories: show_bulk_result(story_ids, stories))
 
 fav_var = tk.BooleanVar()
 fav_check = tk.Checkbutton(
@@ -370,19 +1433,85 @@ progress_frame.pack(fill="x", padx=5, pady=5)
 progress_lbl = tk.Label(progress_frame, text="Words written: 0",
                         bg=BG_MAIN, font=("Monotype Corsiva", 10))
 progress_lbl.pack(anchor="w")
+progress_week_lbl = tk.Label(progress_frame, text="",
+                             bg=BG_MAIN, font=("Monotype Corsiva", 10))
+progress_week_lbl.pack(anchor="w")
+
+# performance section, shown on demand
+perf_after = None  # pending redraw of the performance panel
+
+def show_metrics():
+    """Redraw the performance panel while it is open."""
+    global perf_after
+    lines = [f"{'operation':<24}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}"]
+    for m in metrics.summary()[:PERF_PANEL_ROWS]:
+        name = f"{m['kind']}:{m['op']}"[:23]
+        lines.append(f"{name:<24}{m['count']:>6}{m['p50_ms']:>8.1f}"
+                     f"{m['p95_ms']:>8.1f}{m['p99_ms']:>8.1f}")
+    perf_lbl.config(text="\n".join(lines) + "\n(milliseconds)")
+    perf_after = root.after(PERF_REFRESH_MS, show_metrics)
+
+def toggle_metrics():
+    """Show or hide the performance panel."""
+    if perf_var.get():
+        perf_frame.pack(fill="x", padx=5, pady=5, after=progress_frame)
+        show_metrics()
+    else:
+        root.after_cancel(perf_after)
+        perf_frame.pack_forget()
+
+def export_metrics(fmt):
+    """Save the collected timings as JSON or Prometheus text."""
+    ext = ".json" if fmt == "json" else ".prom"
+    path = filedialog.asksaveasfilename(
+        title="Export Timings", defaultextension=ext,
+        filetypes=[("JSON", "*.json")] if fmt == "json" else [("Prometheus", "*.prom *.txt")])
+    if not path:
+        return
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(metrics.to_json() if fmt == "json" else metrics.to_prometheus())
+    except OSError as e:
+        messagebox.showerror("Export Timings", f"Could not write {path}:\n{e}")
+
+perf_var = tk.BooleanVar()
+tk.Checkbutton(progress_frame, text="Show performance", variable=perf_var,
+               bg=BG_MAIN, command=toggle_metrics).pack(anchor="w")
+perf_frame = tk.LabelFrame(right_frame, text="Performance",
+                           bg=BG_MAIN, font=("Monotype Corsiva", 11, "italic"))
+perf_lbl = tk.Label(perf_frame, text="", bg=BG_MAIN, justify="left",
+                    font=("Courier", 8))
+perf_lbl.pack(anchor="w")
+perf_btns = tk.Frame(perf_frame, bg=BG_MAIN)
+perf_btns.pack(fill="x")
+for text, fmt in (("JSON...", "json"), ("Prometheus...", "prometheus")):
+    tk.Button(perf_btns, text=text, width=11, command=lambda fmt=fmt: export_metrics(fmt),
+              bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left", padx=3)
+tk.Button(perf_btns, text="Reset", width=6, command=metrics.reset,
+          bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left", padx=3)
 
 # ---------- Buttons under form (CRUD) ----------
 btn_frame = tk.Frame(root, bg=BG_MAIN)
 btn_frame.pack(fill="x", padx=10, pady=5)
 
+form_story_id = None  # story currently loaded into the form
+form_base = None      # the Story as loaded, to detect concurrent saves
+
 def clear_form():
     """Clear all input fields and reset combo boxes / favorite."""
+    global form_story_id, form_base
+    form_story_id = form_base = None
+    # a new story's counts are typed in; a saved one's follow its chapters
+    num_chaps.config(state="normal")
+    word_count.config(state="normal")
     for e in (story_title, author_entry, date_started, date_completed,
               num_chaps, word_count, main_char, last_upd):
         e.delete(0, tk.END)
     genre_var.set("")
     status_var.set("")
     fav_var.set(False)
+    preview_lbl.config(text="")
+    similar_lbl.config(text="")
 
 tk.Button(
     btn_frame,
@@ -429,6 +1558,83 @@ tk.Button(
     font=("Monotype Corsiva", 10)
 ).pack(side="left", padx=3)
 
+tk.Button(
+    btn_frame,
+    text="Bulk Edit...",
+    width=10,
+    command=bulk_edit_stories,
+    bg=BG_MAIN,
+    font=("Monotype Corsiva", 10)
+).pack(side="left", padx=3)
+
+tk.Button(
+    btn_frame,
+    text="Import...",
+    width=10,
+    command=import_stories_from_file,
+    bg=BG_MAIN,
+    font=("Monotype Corsiva", 10)
+).pack(side="left", padx=3)
+
+tk.Button(
+    btn_frame,
+    text="Export...",
+    width=10,
+    command=export_stories_to_file,
+    bg=BG_MAIN,
+    font=("Monotype Corsiva", 10)
+).pack(side="left", padx=3)
+
+# ---------- Filter bar ----------
+filter_frame = tk.Frame(root, bg=BG_MAIN)
+filter_frame.pack(fill="x", padx=10, pady=2)
+
+tk.Label(filter_frame, text="Genre:", bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left")
+filter_genre_var = tk.StringVar()
+ttk.Combobox(filter_frame, textvariable=filter_genre_var, width=10, state="readonly",
+             values=[""] + list(genre_combo["values"])).pack(side="left", padx=3)
+
+tk.Label(filter_frame, text="Status:", bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left")
+filter_status_var = tk.StringVar()
+ttk.Combobox(filter_frame, textvariable=filter_status_var, width=10, state="readonly",
+             values=[""] + list(status_combo["values"])).pack(side="left", padx=3)
+
+filter_fav_var = tk.BooleanVar()
+tk.Checkbutton(filter_frame, text="★ only", variable=filter_fav_var, bg=BG_MAIN,
+               font=("Monotype Corsiva", 10)).pack(side="left", padx=3)
+
+tk.Label(filter_frame, text="Started:", bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left")
+started_from_entry = tk.Entry(filter_frame, width=10)
+started_from_entry.pack(side="left")
+tk.Label(filter_frame, text="–", bg=BG_MAIN).pack(side="left")
+started_to_entry = tk.Entry(filter_frame, width=10)
+started_to_entry.pack(side="left", padx=(0, 3))
+
+tk.Label(filter_frame, text="Words:", bg=BG_MAIN, font=("Monotype Corsiva", 10)).pack(side="left")
+words_min_entry = tk.Entry(filter_frame, width=7)
+words_min_entry.pack(side="left")
+tk.Label(filter_frame, text="–", bg=BG_MAIN).pack(side="left")
+words_max_entry = tk.Entry(filter_frame, width=7)
+words_max_entry.pack(side="left", padx=(0, 3))
+
+tk.Button(
+    filter_frame,
+    text="Apply",
+    width=8,
+    command=apply_filters,
+    bg=BG_MAIN,
+    font=("Monotype Corsiva", 10)
+).pack(side="left", padx=3)
+
+tk.Button(
+    filter_frame,
+    text="Reset",
+    width=8,
+    command=reset_filters,
+    bg=BG_MAIN,
+    font=("Monotype Corsiva", 10)
+).pack(side="left", padx=3)
+
 # ---------- Table ----------
 table_frame = tk.Frame(root, bg=BG_MAIN)
 table_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -449,40 +1655,77 @@ style.configure(
 
 tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=10)
 for col in columns:
-    tree.heading(col, text=col)
+    if col in SORT_COLUMNS:
+        tree.heading(col, text=col, command=lambda c=col: sort_by(c))
+    else:
+        tree.heading(col, text=col)
     tree.column(col, width=80, anchor="center")
 tree.column("Title", width=180, anchor="w")
 tree.column("Main Char", width=120, anchor="w")
 
-vsb = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
-tree.configure(yscrollcommand=vsb.set)
+vsb = ttk.Scrollbar(table_frame, orient="vertical")
+# the one in-memory copy of each loaded story, shared by table, form and library
+story_store = StoryStore(ROW_CACHE_SIZE)
+story_view = VirtualTreeview(tree, vsb, fetch_rows_in_background, story_store)
+# live search only filters the table while the form isn't editing a story
+live_search = LiveSearch(root, story_title, start_story_search, show_search_results,
+                         enabled=lambda: form_story_id is None)
 
 tree.pack(side="left", fill="both", expand=True)
 vsb.pack(side="right", fill="y")
 
 # ---------- when a row is selected, show its data in the form ----------
+def fill_form(story):
+    """Load a story into the input fields; it becomes the edit's base version."""
+    global form_story_id, form_base
+    clear_form()
+    form_story_id = story.id
+    form_base = story
+    story_title.insert(0, story.title)
+    author_entry.insert(0, story.author or "")
+    genre_var.set(story.genre or "")
+    date_started.insert(0, str(story.date_started or ""))
+    date_completed.insert(0, str(story.date_completed or ""))
+    status_var.set(story.status or "")
+    show_counts(story)
+    main_char.insert(0, story.main_character or "")
+    last_upd.insert(0, str(story.last_updated or ""))
+    fav_var.set(bool(story.favorite))
+    preview_lbl.config(text=story.preview or "")
+    
+    def show_preview(text):
+        if form_story_id == story.id:
+            preview_lbl.config(text=text)
+    
+    load_preview(story.id, show_preview)
+    
+    def show_similar(stories):
+        if form_story_id == story.id:
+            similar_lbl.config(text=similar_text(stories, " · "))
+    
+    load_similar(story.id, show_similar)
+
+def show_counts(story):
+    """Show a story's chapter and word counts, read-only, in the form."""
+    for entry, value in ((num_chaps, story.num_chapters), (word_count, story.word_count)):
+        entry.config(state="normal")
+        entry.delete(0, tk.END)
+        entry.insert(0, str(value or ""))
+        entry.config(state="readonly")
+
 def on_row_select(event):
     """Fill the input fields with the selected row so it can be edited."""
-    sel = tree.selection()
-    if not sel:
+    story_id = story_view.current()
+    # scrolling re-selects rows as they come back into view; don't wipe
+    # edits in progress for the story that is already in the form
+    if story_id is None or story_id == form_story_id:
         return
-    values = tree.item(sel[0], "values")
-    
-    # unpack values back into form fields
-    clear_form()
-    story_title.insert(0, values[2])
-    author_entry.insert(0, values[3])
-    genre_var.set(values[4] or "")
-    date_started.insert(0, values[5])
-    date_completed.insert(0, values[6])
-    status_var.set(values[7] or "")
-    num_chaps.insert(0, str(values[8] or ""))
-    word_count.insert(0, str(values[9] or ""))
-    main_char.insert(0, values[10] or "")
-    last_upd.insert(0, values[11] or "")
-    fav_var.set(values[1] == "★")
-
-tree.bind("<<TreeviewSelect>>", on_row_select)
+    story = story_view.story(story_id)
+    if story is None:
+        return
+    fill_form(story)
+
+tree.bind("<<TreeviewSelect>>", on_row_select, add="+")
 
 # ---------- Bottom buttons (Read, Library, New Chapter) ----------
 bottom_frame = tk.Frame(root, bg=BG_MAIN)
@@ -490,90 +1733,404 @@ bottom_frame.pack(fill="x", padx=10, pady=5)
 
 def read_story():
     """Open a new window to 'read' the selected story and update streak."""
-    sel = tree.selection()
-    if not sel:
+    story_id = story_view.current()
+    if story_id is None:
         messagebox.showwarning("Read Story", "Please select a story first.")
         return
     
-    values = tree.item(sel[0], "values")
+    story = story_view.story(story_id)
+    if story is None:
+        return  # row still loading
     
     # update streak
-    update_streak_on_read()
+    update_streak_on_read(story_id)
     
     # create read window
     win = tk.Toplevel(root)
-    win.title(f"Read: {values[2]}")
+    win.title(f"Read: {story.title}")
     win.geometry("500x400")
     
-    tk.Label(win, text=values[2], font=("Monotype Corsiva", 18, "bold")).pack(pady=5)
-    tk.Label(win, text=f"by {values[3]}", font=("Monotype Corsiva", 12)).pack(pady=2)
+    tk.Label(win, text=story.title, font=("Monotype Corsiva", 18, "bold")).pack(pady=5)
+    tk.Label(win, text=f"by {story.author}", font=("Monotype Corsiva", 12)).pack(pady=2)
+    preview = tk.Label(win, text=story.preview or "", wraplength=460, justify="left",
+                       font=("Monotype Corsiva", 11, "italic"))
+    preview.pack(padx=10, pady=2)
+    
+    def show_preview(text):
+        if win.winfo_exists():
+            preview.config(text=text)
+    
+    load_preview(story_id, show_preview)
+    
+    similar = tk.Label(win, text="", wraplength=460, justify="left",
+                       font=("Monotype Corsiva", 10))
+    similar.pack(padx=10)
+    
+    def show_similar(stories):
+        if stories and win.winfo_exists():
+            similar.config(text="You may also like: " + similar_text(stories, ", "))
     
-    # placeholder story text
-    text = tk.Text(win, wrap="word")
-    text.pack(fill="both", expand=True, padx=10, pady=10)
-    text.insert("1.0", "Story content goes here...\n\n(Connect to your real chapters later.)")
-    text.config(state="disabled")
+    load_similar(story_id, show_similar)
+    
+    # chapters are loaded a page at a time as the reader nears the end
+    text_frame = tk.Frame(win)
+    text_frame.pack(fill="both", expand=True, padx=10, pady=10)
+    text = tk.Text(text_frame, wrap="word", state="disabled")
+    text_sb = ttk.Scrollbar(text_frame, orient="vertical", command=text.yview)
+    text.pack(side="left", fill="both", expand=True)
+    text_sb.pack(side="right", fill="y")
+    
+    last_no = 0
+    loading = done = False
+    
+    def show_page(rows):
+        nonlocal last_no, loading, done
+        loading = False
+        done = len(rows) < CHAPTER_PAGE_SIZE
+        if not win.winfo_exists():
+            return
+        text.config(state="normal")
+        if not rows and last_no == 0:
+            text.insert("end", "This story has no chapters yet.")
+        for chapter_no, chapter_title, content in rows:
+            heading = chapter_title or f"Chapter {chapter_no}"
+            text.insert("end", f"{heading}\n\n{content}\n\n")
+            last_no = chapter_no
+        text.config(state="disabled")
+    
+    def failed(error):
+        nonlocal loading, done
+        loading = False
+        done = True
+        show_db_error(error)
+    
+    def load_more():
+        nonlocal loading
+        if loading or done:
+            return
+        loading = True
+        db_worker.submit(fetch_chapters, story_id, last_no,
+                         on_done=show_page, on_error=failed)
+    
+    def on_text_scroll(first, last):
+        text_sb.set(first, last)
+        if float(last) > 0.9:
+            load_more()
+    
+    text.configure(yscrollcommand=on_text_scroll)
+    load_more()
 
 def add_to_library():
-    """Add the selected story to the in‑memory library list."""
-    sel = tree.selection()
-    if not sel:
+    """Put the selected stories on the active library shelf."""
+    if not require_online():
+        return
+    story_ids = story_view.selection()
+    if not story_ids:
         messagebox.showwarning("Library", "Please select a story to add.")
         return
-    values = tree.item(sel[0], "values")
-    library_stories.append(values)
-    messagebox.showinfo("Library", f"'{values[2]}' added to your library.")
+    shelf = active_shelf
+    
+    def added(ids):
+        skipped = len(story_ids) - len(ids)
+        message = f"{len(ids)} stor{'y' if len(ids) == 1 else 'ies'} added to '{shelf}'."
+        if skipped:
+            message += f"\n{skipped} already there."
+        messagebox.showinfo("Library", message)
+    
+    db_worker.submit(add_to_shelf, story_ids, shelf, on_done=added)
 
 def open_library():
-    """Open a window showing all stories stored in library_stories."""
-    if not library_stories:
-        messagebox.showinfo("Library", "Your library is empty.")
+    """Open a window listing a library shelf, loaded a page at a time."""
+    if not require_online():
         return
     
     win = tk.Toplevel(root)
     win.title("My Library")
-    win.geometry("700x300")
+    win.geometry("700x340")
+    
+    top = tk.Frame(win)
+    top.pack(fill="x", padx=10, pady=(10, 0))
+    tk.Label(top, text="Shelf:", font=("Monotype Corsiva", 11)).pack(side="left")
+    shelf_var = tk.StringVar(value=active_shelf)
+    shelf_combo = ttk.Combobox(top, textvariable=shelf_var, width=25)
+    shelf_combo.pack(side="left", padx=5)
+    count_lbl = tk.Label(top, text="", font=("Monotype Corsiva", 10))
+    count_lbl.pack(side="left", padx=5)
     
+    frame = tk.Frame(win)
+    frame.pack(fill="both", expand=True, padx=10, pady=10)
     cols = ("ID", "Fav", "Title", "Author", "Genre", "Status")
-    lib_tree = ttk.Treeview(win, columns=cols, show="headings")
+    lib_tree = ttk.Treeview(frame, columns=cols, show="headings")
     for c in cols:
         lib_tree.heading(c, text=c)
         lib_tree.column(c, width=100, anchor="center")
     lib_tree.column("Title", width=200, anchor="w")
+    lib_sb = ttk.Scrollbar(frame, orient="vertical")
+    def fetch_rows(ids, done):
+        # drop answers that arrive after the window was closed
+        fetch_rows_in_background(ids, lambda rows: win.winfo_exists() and done(rows))
+    
+    lib_view = VirtualTreeview(
+        lib_tree, lib_sb, fetch_rows, story_store,
+        row_values=lambda s: (s.id, "★" if s.favorite else "", s.title,
+                              s.author, s.genre, s.status or ""),
+        name="library")
+    lib_tree.pack(side="left", fill="both", expand=True)
+    lib_sb.pack(side="right", fill="y")
     
-    for row in library_stories:
-        lib_tree.insert("", "end", values=(row[0], row[1], row[2], row[3], row[4], row[7]))
+    def show_shelves(rows):
+        if win.winfo_exists():
+            counts = dict(rows)
+            shelf_combo["values"] = sorted(set(counts) | {DEFAULT_SHELF, active_shelf})
+            count_lbl.config(text=f"{counts.get(active_shelf, 0):,} stories")
     
-    lib_tree.pack(fill="both", expand=True, padx=10, pady=10)
+    def show_shelf():
+        """Load the active shelf lazily: pages are joined to stories on demand."""
+        last_key = [None]
+        shelf = active_shelf
+        
+        def more(loaded, done):
+            def arrived(result):
+                if not win.winfo_exists():
+                    return
+                stories, last_key[0] = result
+                for story in stories:
+                    story_store.put(story)
+                done(array("q", (story.id for story in stories)))
+            def failed(error):
+                done(None)
+                show_db_error(error)
+            db_worker.submit(fetch_shelf_page, shelf, last_key[0],
+                             on_done=arrived, on_error=failed)
+        
+        lib_view.set_ids(array("q"), reset=True, sorted_by_id=False, more=more)
+        db_worker.submit(list_shelves, on_done=show_shelves)
+    
+    def switch_shelf(event=None):
+        global active_shelf
+        name = shelf_var.get().strip()
+        if name and name != active_shelf:
+            active_shelf = name
+            show_shelf()
+    
+    def remove_selected():
+        story_ids = lib_view.selection()
+        if not story_ids or not require_online():
+            return
+        
+        def removed(ids):
+            for story_id in ids:
+                lib_view.remove(story_id)
+            db_worker.submit(list_shelves, on_done=show_shelves)
+        
+        db_worker.submit(remove_from_shelf, story_ids, active_shelf, on_done=removed)
+    
+    shelf_combo.bind("<<ComboboxSelected>>", switch_shelf)
+    shelf_combo.bind("<Return>", switch_shelf)
+    tk.Button(top, text="Remove Selected", width=15, command=remove_selected,
+              bg="#ff9999", font=("Monotype Corsiva", 10)).pack(side="right")
+    show_shelf()
+
+open_drafts = {}  # journal path -> ChapterJournal of each open chapter editor
 
 def add_new_chapter():
-    """Open a simple window where the user can write another chapter."""
-    sel = tree.selection()
-    if not sel:
+    """Open the chapter editor for a new chapter of the selected story."""
+    story_id = story_view.current()
+    if story_id is None:
         messagebox.showwarning("New Chapter", "Please select a story first.")
         return
     
-    values = tree.item(sel[0], "values")
+    story = story_view.story(story_id)
+    if story is None:
+        return  # row still loading
+    
+    try:
+        journal = ChapterJournal.create(story_id, story.title)
+    except OSError as e:
+        messagebox.showerror("New Chapter", f"Could not start the draft journal:\n{e}")
+        return
+    open_chapter_editor(journal)
+
+def open_chapter_editor(journal):
+    """Edit a chapter draft: journaled locally as you type, autosaved in batches.
+
+    Edits reach the journal at most every JOURNAL_EVERY_MS. The draft is
+    written to the database when typing pauses for AUTOSAVE_IDLE_MS, and
+    at least every AUTOSAVE_INTERVAL_MS; each write updates the chapter
+    and the story's word_count and last_updated in one transaction.
+    """
+    story_id = journal.story_id
+    open_drafts[journal.path] = journal
     
     win = tk.Toplevel(root)
-    win.title(f"New Chapter for: {values[2]}")
+    win.title(f"New Chapter for: {journal.title}")
     win.geometry("500x400")
     
-    tk.Label(win, text=f"New Chapter - {values[2]}",
+    tk.Label(win, text=f"New Chapter - {journal.title}",
              font=("Monotype Corsiva", 16, "bold")).pack(pady=5)
     
     chapter_text = tk.Text(win, wrap="word")
+    chapter_text.insert("1.0", journal.text)
+    chapter_text.edit_modified(False)
     chapter_text.pack(fill="both", expand=True, padx=10, pady=10)
+    status_lbl = tk.Label(win, text="", font=("Monotype Corsiva", 10, "italic"))
+    words_lbl = tk.Label(win, text="", font=("Monotype Corsiva", 10))
+    
+    def show_words(words):
+        words_lbl.config(text=f"{words:,} words")
+        unsaved_words[journal.path] = words - journal.flushed_words
+        show_progress()
+    
+    stats = TextStats(chapter_text, on_change=show_words)
+    
+    timers = {}          # "journal" / "idle" / "interval" -> after id
+    saving = False       # a database write is in flight
+    after_save = None    # flush() callback waiting for that write
+    gone = False         # the story was deleted meanwhile
+    
+    def set_status(text):
+        if win.winfo_exists():
+            status_lbl.config(text=text)
+    
+    def cancel_timer(name):
+        after_id = timers.pop(name, None)
+        if after_id is not None:
+            root.after_cancel(after_id)
+    
+    def journal_edits():
+        timers.pop("journal", None)
+        if win.winfo_exists() and journal.record(chapter_text.get("1.0", "end-1c")):
+            set_status("Saved locally")
+    
+    def on_modified(event):
+        if not chapter_text.edit_modified():
+            return
+        chapter_text.edit_modified(False)
+        # keystrokes only arm timers; the text is read when one fires
+        if "journal" not in timers:
+            timers["journal"] = root.after(JOURNAL_EVERY_MS, journal_edits)
+        cancel_timer("idle")
+        timers["idle"] = root.after(AUTOSAVE_IDLE_MS, flush)
+    
+    def on_interval():
+        timers["interval"] = root.after(AUTOSAVE_INTERVAL_MS, on_interval)
+        flush()
+    
+    def flush(then=None):
+        """Write the journaled draft to the database, then call `then()`."""
+        nonlocal saving, after_save
+        cancel_timer("idle")
+        cancel_timer("journal")
+        journal_edits()
+        if saving:
+            after_save = then or after_save
+            return
+        if gone or offline:
+            return
+        empty = not journal.text.strip() and journal.chapter_no is None
+        if not journal.pending or empty:
+            if then is not None:
+                then()
+            return
+        seq, text, words = journal.seq, journal.text, stats.words
+        saving = True
+        
+        def saved(result):
+            nonlocal saving, gone, after_save
+            saving = False
+            done, after_save = then or after_save, None
+            chapter_no, story = result
+            if story is None:
+                gone = True
+                story_view.remove(story_id)
+                set_status(f"This story no longer exists; the draft is kept in {journal.path}")
+                return
+            journal.mark_flushed(seq, chapter_no, words)
+            unsaved_words[journal.path] = stats.words - words
+            story_view.update(story)
+            if form_story_id == story_id:
+                show_counts(story)
+            refresh_activity()
+            set_status(f"Saved to the database at {time.strftime('%H:%M:%S')}")
+            if journal.pending:
+                # edits made while this write was in flight go out first
+                flush(done)
+            elif done is not None:
+                done()
+        
+        def failed(error):
+            nonlocal saving, after_save
+            saving = False
+            after_save = None
+            set_status(f"Database save failed, kept locally: {error}")
+        
+        db_worker.submit(save_chapter, story_id, text, journal.chapter_no,
+                         on_done=saved, on_error=failed)
     
-    def save_chapter():
-        content = chapter_text.get("1.0", "end").strip()
-        if not content:
-            messagebox.showwarning("New Chapter", "Chapter is empty.")
+    def finish():
+        open_drafts.pop(journal.path, None)
+        unsaved_words.pop(journal.path, None)
+        show_progress()
+        journal.close(discard=not journal.pending)
+    
+    def save_chapter_now():
+        journal_edits()
+        if not journal.text.strip() and journal.chapter_no is None:
+            messagebox.showwarning("New Chapter", "Chapter is empty.", parent=win)
+            return
+        if not require_online():
             return
-        messagebox.showinfo("New Chapter", "Chapter saved (placeholder).")
+        
+        def done():
+            for name in list(timers):
+                cancel_timer(name)
+            finish()
+            messagebox.showinfo("New Chapter", "Chapter saved.")
+            if win.winfo_exists():
+                win.destroy()
+        
+        flush(done)
+    
+    def on_close():
+        # whatever hasn't reached the database stays journaled for next launch
+        for name in list(timers):
+            cancel_timer(name)
+        journal_edits()
         win.destroy()
+        if journal.pending and not offline and not gone:
+            flush(finish)
+        else:
+            finish()
     
-    tk.Button(win, text="Save Chapter", command=save_chapter).pack(pady=5)
+    chapter_text.bind("<<Modified>>", on_modified, add="+")
+    win.protocol("WM_DELETE_WINDOW", on_close)
+    timers["interval"] = root.after(AUTOSAVE_INTERVAL_MS, on_interval)
+    tk.Button(win, text="Save Chapter", command=save_chapter_now).pack(pady=5)
+    words_lbl.pack()
+    status_lbl.pack(pady=(0, 5))
+    show_words(stats.words)
+    if journal.pending:
+        set_status("Recovered draft - not yet in the database")
+        flush()
+
+def recover_drafts():
+    """Offer to reopen chapter drafts an earlier session left unsaved."""
+    for journal in ChapterJournal.recover():
+        if journal.path in open_drafts:
+            journal.close()
+            continue
+        if not journal.pending:
+            journal.close(discard=True)  # everything reached the database
+            continue
+        answer = messagebox.askyesnocancel(
+            "Recovered Draft",
+            f"An unsaved chapter for '{journal.title}' was recovered "
+            f"({count_words(journal.text):,} words).\n\n"
+            "Yes: open it and save it\nNo: discard it\nCancel: ask again next time")
+        if answer:
+            open_chapter_editor(journal)
+        else:
+            journal.close(discard=answer is False)
 
 read_btn = tk.Button(
     bottom_frame,
@@ -615,19 +2172,115 @@ new_ch_btn = tk.Button(
 )
 new_ch_btn.pack(side="left", padx=3)
 
+# busy indicator, shown only while the DB worker has jobs in flight
+busy_bar = ttk.Progressbar(bottom_frame, mode="indeterminate", length=120)
+
 # ---------- Initialize database and load data ----------
+mode_lbl = tk.Label(bottom_frame, text="", bg=BG_MAIN,
+                    font=("Monotype Corsiva", 10, "italic"))
+mode_lbl.pack(side="right", padx=3)
+db_error_shown = False
+reconnecting = False    # a (re)connect attempt is scheduled or under way
+change_listener = None  # ChangeListener, once the database has been reached
+
+def set_offline(value, message=""):
+    """Switch between live PostgreSQL data and the read-only cached copy."""
+    global offline
+    offline = value
+    mode_lbl.config(text=message)
+
+def connect_database():
+    """Set up the schema and read the streak off the Tk thread."""
+    global reconnecting
+    reconnecting = True
+    db_worker.submit(init_database, on_done=database_ready, on_error=database_failed,
+                     timeout=None)
+
+def database_ready(result):
+    global change_listener, db_error_shown, reconnecting
+    last_date, cur_s, long_s = result
+    db_error_shown = reconnecting = False
+    # a full table painted from the snapshot is patched by the sync below
+    # instead of being streamed again
+    patch = offline and table_shows_all and local_cache is not None \
+        and local_cache.has_snapshot()
+    set_offline(False)
+    show_streak(cur_s, long_s)
+    refresh_activity()
+    if not patch:
+        load_stories_to_tree()
+    recover_drafts()
+    refresh_similar()
+    if change_listener is None:
+        # hand notifications from the listener thread to the Tk thread
+        change_listener = ChangeListener(
+            lambda changes: db_worker.call_soon(apply_remote_changes, changes))
+        change_listener.start()
+    if local_cache is not None:
+        # bring the snapshot up to date for the next launch / outage
+        def synced(delta):
+            if patch:
+                apply_cache_delta(*delta)
+        def failed(error):
+            mode_lbl.config(text=f"Cache sync failed: {error}")
+            if patch:
+                load_stories_to_tree()
+        db_worker.submit(sync_local_cache, local_cache, timeout=None,
+                         on_done=synced, on_error=failed)
+
+def apply_cache_delta(changed, deleted):
+    """Patch a table painted from the cache with what changed since its sync."""
+    if len(changed) + len(deleted) > NOTIFY_MAX_IDS:
+        apply_remote_changes([{"table": "stories", "ids": None}])
+        return
+    apply_remote_changes([{"table": "stories", "op": "DELETE", "ids": deleted},
+                          {"table": "stories", "op": "UPDATE", "ids": changed}])
+
+def database_failed(e):
+    global db_error_shown, reconnecting
+    if local_cache is not None and local_cache.has_snapshot():
+        if not offline:
+            set_offline(True)
+            load_stories_to_tree()
+            show_streak(*local_cache.get_streak()[1:])
+        set_offline(True, "Offline - read-only (cached copy)")
+    elif not db_error_shown:
+        messagebox.showerror("Database Error", 
+                            f"Failed to connect to PostgreSQL:\n{str(e)}\n\n"
+                            "Please check the DB_* connection settings in tale_repository.py.")
+    db_error_shown = reconnecting = True
+    root.after(RECONNECT_INTERVAL * 1000, connect_database)
+
+def connection_lost(error):
+    """A job found the server gone mid-session: go read-only and retry."""
+    if not reconnecting:
+        database_failed(error)
+
+db_worker.on_disconnect = similar_worker.on_disconnect = connection_lost
+
+# paint the last snapshot at once, then reconcile with PostgreSQL in the background
 try:
-    init_streak_table()
-    init_stories_table()
+    local_cache = LocalCache()
+except sqlite3.Error:
+    local_cache = None
+similar_index = open_similarity_index()
+if local_cache is not None and local_cache.has_snapshot():
+    set_offline(True, "Connecting... showing the cached copy")
     load_stories_to_tree()
-    
-    # Load initial streak
-    last_date, cur_s, long_s = get_streak()
-    streak_lbl.config(text=f"Current streak: {cur_s} day(s)")
-    longest_lbl.config(text=f"Longest streak: {long_s} day(s)")
-except Exception as e:
-    messagebox.showerror("Database Error", 
-                        f"Failed to connect to PostgreSQL:\n{str(e)}\n\n"
-                        "Please check your connection settings at the top of the file.")
+    show_streak(*local_cache.get_streak()[1:])
+connect_database()
 
 root.mainloop()
+
+# release pooled connections once the window is closed
+if change_listener is not None:
+    change_listener.stop()
+db_worker.shutdown()
+similar_worker.shutdown()
+if similar_index is not None:
+    similar_index.save()  # no-op when nothing changed since the last save
+for journal in list(open_drafts.values()):
+    journal.close()  # kept for recovery unless already saved
+close_pool()
+if local_cache is not None:
+    local_cache.close()
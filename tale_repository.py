@@ -0,0 +1,2501 @@
+"""Database access for Tale Keeper, with no Tk dependency.
+
+Every helper takes an open psycopg2 connection (`con`) and returns plain
+Python data, so the GUI in eme.py, scripts and the benchmarks in
+benchmarks/ can share the same queries.
+"""
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, cursor as PgCursor
+from psycopg2.pool import PoolError
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date
+import csv
+import io
+import json
+import os
+import re
+import select
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zipfile
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # "similar stories" is simply unavailable without it
+    np = None
+
+# PostgreSQL configuration - UPDATE THESE CONNECTION DETAILS
+DB_HOST = "localhost"  # or your host
+DB_NAME = "tale_keeper"
+DB_USER = "shane"
+DB_PASSWORD = "xshanex"
+DB_PORT = "5432"
+
+DB_CONNECT_TIMEOUT = 5     # seconds before giving up on a new connection
+DB_STATEMENT_TIMEOUT = 30  # server-side cap on any single statement (seconds)
+
+# connection pool settings
+DB_POOL_MAX = 5            # most connections open at once
+DB_POOL_TIMEOUT = 10       # seconds to wait for a free connection
+DB_HEALTH_CHECK_AFTER = 30 # ping connections idle longer than this (seconds)
+
+# query sizes
+PREVIEW_SNIPPET = 80       # preview characters sent with each list row
+SEARCH_PAGE_SIZE = 200     # ranked search results fetched per page
+SORT_PAGE_SIZE = 500       # sorted/filtered rows fetched per keyset page
+STREAM_ITERSIZE = 2000     # rows per round-trip from the server-side cursor
+CHAPTER_PAGE_SIZE = 5      # chapters loaded into the reader at a time
+IMPORT_BATCH_SIZE = 5000   # records validated and sent per COPY batch
+LIBRARY_PAGE_SIZE = 200    # shelf entries fetched per page
+
+DEFAULT_SHELF = "My Library"
+
+# local cache for instant startup / offline viewing
+CACHE_PATH = os.path.join(
+    os.path.expanduser("~"),
+    ".tale_keeper_cache_" + re.sub(r"\W+", "_", f"{DB_HOST}_{DB_PORT}_{DB_NAME}") + ".sqlite3")
+SYNC_OVERLAP = 1000        # change numbers re-read on each sync
+
+# "similar stories" index
+SIMILAR_PATH = CACHE_PATH[:-len(".sqlite3")] + "_similar.npz"
+SIMILAR_DIM = 1 << 20          # hashed feature buckets
+SIMILAR_TOP_K = 5              # neighbours returned by default
+SIMILAR_MAX_DF = 0.3           # features in more stories than this are ignored...
+SIMILAR_MIN_COMMON = 5         # ...unless they are in no more than this many
+SIMILAR_REBUILD_ROWS = 5000    # rows scored without postings before a rebuild
+SIMILAR_REBUILD_DEAD = 0.2     # share of replaced rows that triggers a rebuild
+
+# chapter editor autosave journal
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".tale_keeper_drafts")
+JOURNAL_FSYNC_INTERVAL = 1.0       # most seconds of edits a power cut can lose
+JOURNAL_COMPACT_BYTES = 1_000_000  # rewrite a journal as one snapshot past this
+
+# live sync between running instances
+NOTIFY_CHANNEL = "tale_keeper_changes"
+NOTIFY_MAX_IDS = 500       # above this a notification just says "reload"
+
+# instrumentation
+METRIC_BUCKETS_MS = tuple(0.05 * 2 ** i for i in range(20))  # 0.05 ms .. ~26 s
+
+def get_connection():
+    """Get PostgreSQL connection."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT * 1000}",
+        cursor_factory=TracingCursor
+    )
+
+# ---------- instrumentation ----------
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds) with a row counter."""
+
+    def __init__(self, bounds=METRIC_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def observe(self, ms, rows=None):
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if rows is not None:
+            self.rows += rows
+
+    def percentile(self, pct):
+        """Estimate a percentile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = self.count * pct / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                return min(low + (high - low) * (rank - seen) / n, self.max_ms)
+            seen += n
+        return self.max_ms
+
+class Metrics:
+    """Thread-safe registry of Histograms keyed by (kind, operation).
+
+    Kinds used here: connect, pool_wait, query, fetch (tale_repository),
+    op, callback and render (eme.py).
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, op, ms, rows=None):
+        with self._lock:
+            histogram = self._histograms.get((kind, op))
+            if histogram is None:
+                histogram = self._histograms[(kind, op)] = Histogram()
+            histogram.observe(ms, rows)
+
+    @contextmanager
+    def timer(self, kind, op, rows=None):
+        """Time a `with` block; `rows` may be a callable evaluated afterwards."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.observe(kind, op, ms, rows() if callable(rows) else rows)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def summary(self):
+        """Return [{kind, op, count, rows, p50_ms, p95_ms, p99_ms, max_ms}], slowest p95 first."""
+        with self._lock:
+            items = [(key, h.count, h.rows, h.percentile(50), h.percentile(95),
+                      h.percentile(99), h.max_ms) for key, h in self._histograms.items()]
+        keys = ("count", "rows", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+        rows = [dict(kind=kind, op=op, **dict(zip(keys, values)))
+                for (kind, op), *values in items]
+        return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)
+
+    def to_json(self):
+        """Summary plus raw buckets, as a JSON string."""
+        with self._lock:
+            buckets = {f"{kind}:{op}": {"le_ms": list(h.bounds), "counts": list(h.counts),
+                                        "sum_ms": h.total_ms}
+                       for (kind, op), h in self._histograms.items()}
+        return json.dumps({"summary": self.summary(), "buckets": buckets}, indent=2)
+
+    def to_prometheus(self, prefix="tale_keeper"):
+        """Prometheus text exposition format (seconds, cumulative buckets)."""
+        lines = [f"# HELP {prefix}_duration_seconds Time spent per operation.",
+                 f"# TYPE {prefix}_duration_seconds histogram"]
+        rows = [f"# HELP {prefix}_rows_total Rows handled per operation.",
+                f"# TYPE {prefix}_rows_total counter"]
+        with self._lock:
+            for (kind, op), h in sorted(self._histograms.items()):
+                labels = f'kind="{kind}",op="{op}"'
+                cumulative = 0
+                for bound, n in zip(h.bounds + (float("inf"),), h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound / 1000)
+                    lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{prefix}_duration_seconds_sum{{{labels}}} {h.total_ms / 1000}")
+                lines.append(f"{prefix}_duration_seconds_count{{{labels}}} {h.count}")
+                rows.append(f"{prefix}_rows_total{{{labels}}} {h.rows}")
+        return "\n".join(lines + rows) + "\n"
+
+metrics = Metrics()
+_trace_local = threading.local()
+
+@contextmanager
+def traced_operation(name):
+    """Label the queries run by this thread inside the block with `name`."""
+    outer = getattr(_trace_local, "op", None)
+    _trace_local.op = name
+    try:
+        yield
+    finally:
+        _trace_local.op = outer
+
+class TracingCursor(PgCursor):
+    """Cursor that times execute (query) and fetch* (fetch) into `metrics`."""
+
+    def execute(self, query, vars=None):
+        op = getattr(_trace_local, "op", None) or "other"
+        with metrics.timer("query", op, rows=lambda: max(self.rowcount, 0)):
+            return super().execute(query, vars)
+
+    def fetchone(self):
+        op = getattr(_trace_local, "op", None) or "other"
+        start = time.perf_counter()
+        row = super().fetchone()
+        metrics.observe("fetch", op, (time.perf_counter() - start) * 1000, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        op = getattr(_trace_local, "op", None) or "other"
+        start = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        metrics.observe("fetch", op, (time.perf_counter() - start) * 1000, len(rows))
+        return rows
+
+    def fetchall(self):
+        op = getattr(_trace_local, "op", None) or "other"
+        start = time.perf_counter()
+        rows = super().fetchall()
+        metrics.observe("fetch", op, (time.perf_counter() - start) * 1000, len(rows))
+        return rows
+
+# ---------- connection pool ----------
+class ConnectionPool:
+    """Bounded, thread-safe pool of warm PostgreSQL connections.
+
+    Connections are handed out most-recently-used first, pinged before reuse
+    when they have been idle for a while, and replaced transparently when
+    the server has dropped them.
+    """
+
+    def __init__(self, connect, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 check_after=DB_HEALTH_CHECK_AFTER):
+        self._connect = connect
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = deque()   # (connection, last_used) pairs
+        self._size = 0         # open connections, idle + checked out
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "connects": 0, "checkouts": 0, "reuses": 0, "waits": 0,
+            "timeouts": 0, "health_checks": 0, "reconnects": 0, "discarded": 0,
+        }
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _is_healthy(self, con, last_used):
+        """Return True if an idle connection can be handed out again."""
+        if con.closed:
+            return False
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        self._count("health_checks")
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            con.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(con):
+        try:
+            con.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` for a free slot."""
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        con = last_used = None
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    con, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolError("connection pool exhausted")
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+        if waited:
+            metrics.observe("pool_wait", "pool", (time.perf_counter() - started) * 1000)
+
+        if con is not None:
+            if self._is_healthy(con, last_used):
+                self._count("reuses")
+                return con
+            self._close_quietly(con)
+            self._count("reconnects")
+
+        try:
+            with metrics.timer("connect", "pool"):
+                con = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._count("connects")
+        return con
+
+    def putconn(self, con, discard=False):
+        """Return a connection; broken or discarded ones are closed."""
+        if not discard and not con.closed:
+            try:
+                if con.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    con.rollback()
+            except psycopg2.Error:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                if discard:
+                    self._stats["discarded"] += 1
+            else:
+                self._idle.append((con, time.monotonic()))
+            self._cond.notify()
+        if discard or self._closed:
+            self._close_quietly(con)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a `with` block."""
+        con = self.getconn()
+        try:
+            yield con
+        finally:
+            self.putconn(con)
+
+    def stats(self):
+        """Return a snapshot of pool counters and current occupancy."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                maxconn=self.maxconn,
+            )
+        return snapshot
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = [con for con, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for con in idle:
+            self._close_quietly(con)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the shared connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(get_connection)
+        return _pool
+
+def db_connection():
+    """Borrow a pooled connection: `with db_connection() as con: ...`."""
+    return get_pool().connection()
+
+def is_disconnect(error):
+    """True if `error` means the server is gone or unreachable, not a failed query."""
+    # server-side errors (a cancelled or timed-out query included) carry a SQLSTATE
+    return isinstance(error, psycopg2.InterfaceError) or (
+        isinstance(error, psycopg2.OperationalError) and error.pgcode is None)
+
+def pool_stats():
+    """Return connection pool statistics (checkouts, reuses, reconnects...)."""
+    return get_pool().stats()
+
+def close_pool():
+    """Close every pooled connection (on exit)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+# ---------- prepared statements ----------
+# hot queries are parsed and planned once per connection (PREPARE) and then
+# only EXECUTEd; the names a connection has prepared die with it
+_statement_names = {}                     # sql -> statement name
+_prepared = weakref.WeakKeyDictionary()   # connection -> names prepared there
+_prepared_lock = threading.Lock()
+
+def _numbered(sql):
+    """Turn psycopg2 %s placeholders into PREPARE's $1, $2..."""
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%[s%]", lambda m: "%" if m.group() == "%%" else f"${next(counter)}", sql)
+
+def execute_prepared(cur, sql, params=()):
+    """Run `sql` (with %s placeholders) as a prepared statement.
+
+    The statement is prepared on the cursor's connection the first time it
+    is seen there; afterwards only EXECUTE and the parameters are sent.
+    """
+    con = cur.connection
+    with _prepared_lock:
+        name = _statement_names.setdefault(sql, f"tale_{len(_statement_names) + 1}")
+        prepared = _prepared.setdefault(con, set())
+        fresh = name not in prepared
+    if fresh:
+        # PREPARE outlives a rollback, so it is remembered once it succeeds
+        cur.execute(f"PREPARE {name} AS {_numbered(sql)}")
+        with _prepared_lock:
+            prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+def prepared_statements(con):
+    """Return {name: sql} for the statements prepared on `con`."""
+    with _prepared_lock:
+        names = _prepared.get(con, set())
+        return {name: sql for sql, name in _statement_names.items() if name in names}
+
+# ---------- streak DB helpers ----------
+def init_streak_table(con):
+    """Create streak table if it does not exist and ensure one row."""
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reading_streak (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_read_date DATE,
+            current_streak INTEGER DEFAULT 0,
+            longest_streak INTEGER DEFAULT 0
+        )
+    """)
+    cur.execute(
+        "INSERT INTO reading_streak (id, last_read_date, current_streak, longest_streak) "
+        "VALUES (1, NULL, 0, 0) ON CONFLICT (id) DO NOTHING"
+    )
+
+def get_streak(con):
+    """Return (last_read_date, current_streak, longest_streak)."""
+    cur = con.cursor()
+    cur.execute("SELECT last_read_date, current_streak, longest_streak FROM reading_streak WHERE id = 1")
+    row = cur.fetchone()
+    con.commit()
+    return row if row else (None, 0, 0)
+
+def record_read(con, story_id=None):
+    """Log a read; return (current, longest), or None if today was already counted.
+
+    The streak itself is advanced by the activity_events trigger, in the
+    same transaction as the event.
+    """
+    cur = con.cursor()
+    execute_prepared(cur, """
+        INSERT INTO activity_events (kind, story_id) VALUES ('read', %s)
+        RETURNING occurred_at::date
+    """, (story_id,))
+    day = cur.fetchone()[0]
+    execute_prepared(cur, """
+        SELECT d.reads, s.current_streak, s.longest_streak
+        FROM activity_daily d, reading_streak s
+        WHERE d.day = %s AND s.id = 1
+    """, (day,))
+    reads, current_streak, longest_streak = cur.fetchone()
+    con.commit()
+    if reads > 1:
+        return None
+    return current_streak, longest_streak
+
+# ---------- activity log ----------
+def init_activity_tables(con):
+    """Create the append-only activity log and its daily rollup.
+
+    Every read or write is one activity_events row (with the story and its
+    word delta). A trigger folds each event into activity_daily and the
+    reading_streak summary row as it is inserted, so dashboard figures are
+    single-row lookups; rebuild_activity_stats() recomputes both from the
+    log.
+    """
+    cur = con.cursor()
+    cur.execute("""
+        ALTER TABLE reading_streak
+        ADD COLUMN IF NOT EXISTS words_written BIGINT NOT NULL DEFAULT 0
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activity_events (
+            id BIGSERIAL PRIMARY KEY,
+            occurred_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            kind TEXT NOT NULL CHECK (kind IN ('read', 'write')),
+            story_id INTEGER REFERENCES stories(id) ON DELETE SET NULL,
+            words INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS activity_events_story_idx
+        ON activity_events (story_id, occurred_at)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            day DATE PRIMARY KEY,
+            reads INTEGER NOT NULL DEFAULT 0,
+            words_written BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION activity_apply_event() RETURNS trigger AS $$
+        DECLARE
+            event_day DATE := NEW.occurred_at::date;
+            day_reads INTEGER;
+        BEGIN
+            INSERT INTO activity_daily AS d (day, reads, words_written)
+            VALUES (event_day, (NEW.kind = 'read')::int, NEW.words)
+            ON CONFLICT (day) DO UPDATE
+            SET reads = d.reads + EXCLUDED.reads,
+                words_written = d.words_written + EXCLUDED.words_written
+            RETURNING d.reads INTO day_reads;
+
+            IF NEW.kind = 'read' AND day_reads = 1 THEN
+                -- first read of the day: extend or restart the streak in one
+                -- statement; every SET sees the row as locked by this UPDATE,
+                -- so concurrent reads can't both build on a stale value
+                UPDATE reading_streak
+                SET current_streak = CASE
+                        WHEN last_read_date = event_day - 1 THEN current_streak + 1
+                        WHEN last_read_date >= event_day THEN current_streak
+                        ELSE 1 END,
+                    longest_streak = GREATEST(longest_streak, CASE
+                        WHEN last_read_date = event_day - 1 THEN current_streak + 1
+                        WHEN last_read_date >= event_day THEN current_streak
+                        ELSE 1 END),
+                    last_read_date = GREATEST(last_read_date, event_day),
+                    words_written = words_written + NEW.words
+                WHERE id = 1;
+            ELSIF NEW.words <> 0 THEN
+                UPDATE reading_streak
+                SET words_written = words_written + NEW.words
+                WHERE id = 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER activity_events_apply
+        AFTER INSERT ON activity_events
+        FOR EACH ROW EXECUTE FUNCTION activity_apply_event()
+    """)
+    # a streak counted before the log existed becomes its trailing run of reads
+    cur.execute("""
+        INSERT INTO activity_events (occurred_at, kind)
+        SELECT s.last_read_date - n, 'read'
+        FROM reading_streak s, generate_series(0, s.current_streak - 1) AS n
+        WHERE s.id = 1 AND s.last_read_date IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM activity_events)
+    """)
+
+def log_writing(con, story_id, words):
+    """Log `words` written (or removed, if negative) on a story; no commit."""
+    if words:
+        con.cursor().execute(
+            "INSERT INTO activity_events (kind, story_id, words) VALUES ('write', %s, %s)",
+            (story_id, words))
+
+def get_activity_stats(con):
+    """Return the dashboard figures from the summary row and a week of rollups."""
+    cur = con.cursor()
+    execute_prepared(cur, """
+        SELECT s.last_read_date, s.current_streak, s.longest_streak, s.words_written,
+               COALESCE(sum(d.words_written) FILTER (WHERE d.day = CURRENT_DATE), 0),
+               COALESCE(sum(d.words_written), 0)
+        FROM reading_streak s
+        LEFT JOIN activity_daily d ON d.day > CURRENT_DATE - 7
+        WHERE s.id = 1
+        GROUP BY s.id
+    """)
+    row = cur.fetchone()
+    con.commit()
+    if row is None:
+        row = (None, 0, 0, 0, 0, 0)
+    keys = ("last_read_date", "current_streak", "longest_streak",
+            "words_written", "words_today", "words_week")
+    return dict(zip(keys, row))
+
+# (last_read_date, current, longest) from activity_daily alone: consecutive
+# reading days share one (day - row number) value, and each group is a streak
+DERIVE_STREAK_SQL = """
+    WITH runs AS (
+        SELECT max(day) AS last_day, count(*) AS length
+        FROM (SELECT day, day - row_number() OVER (ORDER BY day)::int AS grp
+              FROM activity_daily WHERE reads > 0) days
+        GROUP BY grp
+    )
+    SELECT (SELECT max(last_day) FROM runs) AS last_read_date,
+           COALESCE((SELECT length FROM runs ORDER BY last_day DESC LIMIT 1), 0)
+               AS current_streak,
+           COALESCE((SELECT max(length) FROM runs), 0) AS longest_streak
+"""
+
+def derive_streak(con):
+    """Recompute (last_read_date, current, longest) from the activity log."""
+    cur = con.cursor()
+    cur.execute(DERIVE_STREAK_SQL)
+    row = cur.fetchone()
+    con.commit()
+    return row
+
+def verify_streak(con):
+    """Compare the stored streak with the one derived from the log.
+
+    Returns (stored, derived); they are equal when the summary is sound.
+    """
+    return tuple(get_streak(con)), tuple(derive_streak(con))
+
+def rebuild_activity_stats(con):
+    """Recompute activity_daily and the streak summary from activity_events."""
+    cur = con.cursor()
+    cur.execute("LOCK TABLE activity_events IN SHARE MODE")
+    cur.execute("DELETE FROM activity_daily")
+    cur.execute("""
+        INSERT INTO activity_daily (day, reads, words_written)
+        SELECT occurred_at::date, count(*) FILTER (WHERE kind = 'read'), sum(words)
+        FROM activity_events GROUP BY 1
+    """)
+    cur.execute("""
+        UPDATE reading_streak
+        SET words_written = (SELECT COALESCE(sum(words_written), 0) FROM activity_daily)
+        WHERE id = 1
+    """)
+    cur.execute(f"""
+        UPDATE reading_streak s
+        SET last_read_date = r.last_read_date,
+            current_streak = r.current_streak,
+            longest_streak = r.longest_streak
+        FROM ({DERIVE_STREAK_SQL}) r
+        WHERE s.id = 1
+    """)
+    con.commit()
+
+# ---------- Story DB helpers ----------
+def init_stories_table(con):
+    """Create stories table if it does not exist and add the search columns."""
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stories (
+            id SERIAL PRIMARY KEY,
+            favorite BOOLEAN DEFAULT FALSE,
+            title TEXT NOT NULL,
+            author TEXT,
+            genre TEXT,
+            date_started DATE,
+            date_completed DATE,
+            status TEXT,
+            num_chapters INTEGER DEFAULT 0,
+            word_count INTEGER DEFAULT 0,
+            main_character TEXT,
+            last_updated DATE,
+            preview TEXT DEFAULT ''
+        )
+    """)
+    # search: weighted tsvector for ranked full-text matches plus a
+    # lower-cased blob with a trigram index for substring/fuzzy matches
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute("""
+        ALTER TABLE stories ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(author, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(main_character, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(genre, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(preview, '')), 'D')
+        ) STORED
+    """)
+    cur.execute("""
+        ALTER TABLE stories ADD COLUMN IF NOT EXISTS search_text TEXT
+        GENERATED ALWAYS AS (
+            lower(coalesce(title, '') || ' ' || coalesce(author, '') || ' ' ||
+                  coalesce(main_character, '') || ' ' || coalesce(genre, '') || ' ' ||
+                  coalesce(preview, ''))
+        ) STORED
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS stories_search_vector_idx
+        ON stories USING GIN (search_vector)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS stories_search_text_trgm_idx
+        ON stories USING GIN (search_text gin_trgm_ops)
+    """)
+    # bumped on every update (see stories_track_change) for optimistic locking
+    cur.execute("ALTER TABLE stories ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+    compress_previews(con)
+
+def compress_previews(con):
+    """Store new previews with lz4 TOAST compression where the server has it.
+
+    Servers before PostgreSQL 14, or built without lz4, keep the default
+    (pglz); existing values are recompressed only when rewritten. Runs
+    inside a savepoint so the surrounding migration survives a refusal.
+    """
+    cur = con.cursor()
+    cur.execute("SAVEPOINT compress_previews")
+    try:
+        cur.execute("""
+            SELECT attcompression FROM pg_attribute
+            WHERE attrelid = 'stories'::regclass AND attname = 'preview'
+        """)
+        if cur.fetchone()[0] != "l":
+            cur.execute("ALTER TABLE stories ALTER COLUMN preview SET COMPRESSION lz4")
+        cur.execute("RELEASE SAVEPOINT compress_previews")
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT compress_previews")
+
+STORY_FIELDS = ("id", "favorite", "title", "author", "genre", "date_started",
+                "date_completed", "status", "num_chapters", "word_count",
+                "main_character", "last_updated", "preview", "version")
+STORY_FIELD_LIST = ", ".join(STORY_FIELDS)
+
+def story_columns(alias=""):
+    """SELECT list for a Story in list queries: preview is cut to a snippet.
+
+    Only PREVIEW_SNIPPET characters (plus "…" if there was more) leave the
+    server; fetch_preview() returns the whole text.
+    """
+    columns = [alias + field for field in STORY_FIELDS]
+    preview = alias + "preview"
+    columns[STORY_FIELDS.index("preview")] = (
+        f"CASE WHEN length(left({preview}, {PREVIEW_SNIPPET + 1})) > {PREVIEW_SNIPPET} "
+        f"THEN left({preview}, {PREVIEW_SNIPPET}) || '…' ELSE {preview} END AS preview")
+    return ", ".join(columns)
+
+STORY_COLUMNS = story_columns()
+# the fields a story form edits, in Story.values() order
+EDITABLE_FIELDS = STORY_FIELDS[1:12]
+
+class Story:
+    """One stories row, in STORY_FIELDS order.
+
+    Slotted so the row store can hold thousands of them cheaply; the
+    table, the library window and the form all read these directly.
+    """
+    __slots__ = STORY_FIELDS
+
+    def __init__(self, id=None, favorite=False, title="", author=None, genre=None,
+                 date_started=None, date_completed=None, status=None,
+                 num_chapters=0, word_count=0, main_character=None,
+                 last_updated=None, preview=None, version=None):
+        self.id = id
+        self.favorite = favorite
+        self.title = title
+        self.author = author
+        self.genre = genre
+        self.date_started = date_started
+        self.date_completed = date_completed
+        self.status = status
+        self.num_chapters = num_chapters
+        self.word_count = word_count
+        self.main_character = main_character
+        self.last_updated = last_updated
+        self.preview = preview
+        self.version = version
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a Story from a row in STORY_FIELDS order (None stays None)."""
+        return cls(*row) if row is not None else None
+
+    def values(self):
+        """Return the column values insert_story/update_story expect."""
+        return (self.favorite, self.title, self.author, self.genre,
+                self.date_started, self.date_completed, self.status,
+                self.num_chapters, self.word_count, self.main_character,
+                self.last_updated)
+
+    def table_values(self):
+        """Return the values tuple shown in the treeview."""
+        return (
+            self.id, "★" if self.favorite else "", self.title, self.author,
+            self.genre, self.date_started or "", self.date_completed or "",
+            self.status or "", self.num_chapters or 0, self.word_count or 0,
+            self.main_character or "", self.last_updated or "", self.preview or ""
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, Story):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in STORY_FIELDS)
+
+    def __repr__(self):
+        return f"Story(id={self.id!r}, title={self.title!r})"
+
+def get_story(con, story_id):
+    """Return one story (full preview included) as a Story, or None."""
+    cur = con.cursor()
+    execute_prepared(cur, f"SELECT {STORY_FIELD_LIST} FROM stories WHERE id = %s", (story_id,))
+    row = cur.fetchone()
+    con.commit()
+    return Story.from_row(row)
+
+def fetch_preview(con, story_id):
+    """Return a story's full preview text ("" if none, None if the story is gone)."""
+    cur = con.cursor()
+    execute_prepared(cur, "SELECT COALESCE(preview, '') FROM stories WHERE id = %s", (story_id,))
+    row = cur.fetchone()
+    con.commit()
+    return row[0] if row else None
+
+def fetch_story_rows(con, ids):
+    """Return {id: Story} for the given story ids."""
+    cur = con.cursor()
+    execute_prepared(cur, f"SELECT {STORY_COLUMNS} FROM stories WHERE id = ANY(%s)",
+                     (list(ids),))
+    rows = cur.fetchall()
+    con.commit()
+    return {row[0]: Story.from_row(row) for row in rows}
+
+def stream_stories(con, on_chunk, itersize=STREAM_ITERSIZE):
+    """Stream every story in id order through a server-side cursor.
+
+    Rows are fetched `itersize` at a time and passed to `on_chunk(values)`
+    as Story records; returning False from `on_chunk` stops the
+    stream. Client memory never holds more than one chunk.
+    """
+    cur = con.cursor(name="stream_stories")
+    cur.itersize = itersize
+    cur.execute(f"SELECT {STORY_COLUMNS} FROM stories ORDER BY id")
+    while True:
+        rows = cur.fetchmany(itersize)
+        if not rows or on_chunk([Story.from_row(row) for row in rows]) is False:
+            break
+    cur.close()
+    con.commit()
+
+def insert_story(con, values):
+    """Insert a story from form values and return the new row."""
+    cur = con.cursor()
+    cur.execute(f"""
+        INSERT INTO stories (favorite, title, author, genre, date_started, date_completed, 
+                           status, num_chapters, word_count, main_character, last_updated)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING {STORY_COLUMNS}
+    """, values)
+    row = cur.fetchone()
+    con.commit()
+    return Story.from_row(row)
+
+class UpdateConflict(Exception):
+    """Raised when a story changed since the version an edit started from.
+
+    `current` holds the story as it is now.
+    """
+
+    def __init__(self, current):
+        super().__init__(f"story {current.id} was changed by someone else")
+        self.current = current
+
+def update_story(con, story_id, values, version):
+    """Save form values over `version` of a story; return the new row.
+
+    Returns None if the story is gone, and raises UpdateConflict if
+    someone else saved it since `version` was read.
+    """
+    cur = con.cursor()
+    execute_prepared(cur, f"""
+        UPDATE stories 
+        SET favorite = %s, title = %s, author = %s, genre = %s, 
+            date_started = %s, date_completed = %s, status = %s,
+            num_chapters = %s, word_count = %s, main_character = %s, last_updated = %s
+        WHERE id = %s AND version = %s
+        RETURNING {STORY_COLUMNS}
+    """, (*values, story_id, version))
+    row = cur.fetchone()
+    if row is None:
+        execute_prepared(cur, f"SELECT {STORY_COLUMNS} FROM stories WHERE id = %s",
+                         (story_id,))
+        current = cur.fetchone()
+        con.commit()
+        if current is not None:
+            raise UpdateConflict(Story.from_row(current))
+        return None
+    con.commit()
+    return Story.from_row(row)
+
+def _same_value(a, b):
+    # form text vs. database types: blanks, None and 0 count as empty
+    empty = (None, "", 0)
+    if a in empty and b in empty:
+        return True
+    return str(a) == str(b)
+
+def merge_story_values(base, mine, theirs):
+    """Three-way merge of an edit against a concurrent save.
+
+    `base` is the Story the edit started from, `mine` the edited values
+    (Story.values() order) and `theirs` the Story as saved meanwhile.
+    Fields only one side changed take that side's value; returns (merged
+    values, names of fields both changed differently — those keep mine).
+    """
+    merged, conflicts = [], []
+    for field, old, new, other in zip(EDITABLE_FIELDS, base.values(), mine, theirs.values()):
+        if _same_value(new, old):
+            merged.append(other)
+        else:
+            merged.append(new)
+            if not _same_value(other, old) and not _same_value(other, new):
+                conflicts.append(field)
+    return tuple(merged), conflicts
+
+def delete_story(con, story_id):
+    """Delete one story."""
+    cur = con.cursor()
+    cur.execute("DELETE FROM stories WHERE id = %s", (story_id,))
+    con.commit()
+
+def set_favorite(con, story_id, favorite):
+    """Set a story's favorite flag; return the row, or None if gone."""
+    cur = con.cursor()
+    cur.execute(f"UPDATE stories SET favorite = %s WHERE id = %s RETURNING {STORY_COLUMNS}", 
+                (favorite, story_id))
+    row = cur.fetchone()
+    con.commit()
+    return Story.from_row(row)
+
+# columns a multi-row edit may change
+BULK_COLUMNS = ("favorite", "status", "genre")
+
+def bulk_update_stories(con, story_ids, changes):
+    """Apply `changes` ({column: value}) to many stories in one statement.
+
+    Only BULK_COLUMNS may be changed. Returns the updated Story records;
+    ids that no longer exist are simply missing from the result.
+    """
+    unknown = set(changes) - set(BULK_COLUMNS)
+    if unknown:
+        raise ValueError(f"cannot bulk-update {', '.join(sorted(unknown))}")
+    if not changes:
+        return []
+    columns = [c for c in BULK_COLUMNS if c in changes]
+    assignments = ", ".join(f"{c} = %s" for c in columns)
+    cur = con.cursor()
+    cur.execute(f"""
+        UPDATE stories SET {assignments}
+        WHERE id = ANY(%s)
+        RETURNING {STORY_COLUMNS}
+    """, [changes[c] for c in columns] + [list(story_ids)])
+    stories = [Story.from_row(row) for row in cur.fetchall()]
+    con.commit()
+    return stories
+
+def delete_stories(con, story_ids):
+    """Delete many stories in one statement; return the ids actually deleted."""
+    cur = con.cursor()
+    cur.execute("DELETE FROM stories WHERE id = ANY(%s) RETURNING id", (list(story_ids),))
+    deleted = [row[0] for row in cur.fetchall()]
+    con.commit()
+    return deleted
+
+def _prefix_tsquery(term):
+    """Build a to_tsquery() string that prefix-matches every word of `term`."""
+    words = re.findall(r"\w+", term)
+    return " & ".join(f"{word}:*" for word in words)
+
+def search_story_ids(con, term, limit=SEARCH_PAGE_SIZE, offset=0):
+    """Return one page of story ids matching `term`, best matches first.
+
+    Searches title, author, main character, genre and preview. Words are
+    matched through the full-text index (prefixes included); terms of three
+    or more characters also match as substrings or fuzzily via pg_trgm.
+    """
+    term = term.strip().lower()
+    tsquery = _prefix_tsquery(term)
+    if not tsquery:
+        return array("q")
+    
+    if len(term) < 3:
+        # too short for trigrams; the full-text prefix match is enough
+        sql = """
+            SELECT id
+            FROM stories, to_tsquery('english', %s) AS query
+            WHERE search_vector @@ query
+            ORDER BY ts_rank_cd(search_vector, query) DESC, id
+            LIMIT %s OFFSET %s
+        """
+        params = (tsquery, limit, offset)
+    else:
+        sql = """
+            SELECT id
+            FROM stories, to_tsquery('english', %s) AS query
+            WHERE search_vector @@ query
+               OR search_text LIKE %s
+               OR %s <%% search_text
+            ORDER BY ts_rank_cd(search_vector, query)
+                     + word_similarity(%s, search_text) DESC, id
+            LIMIT %s OFFSET %s
+        """
+        like = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        params = (tsquery, like, term, term, limit, offset)
+    cur = con.cursor()
+    execute_prepared(cur, sql, params)
+    ids = array("q", (row[0] for row in cur))
+    con.commit()
+    return ids
+
+# ---------- sorting / filtering / keyset pagination ----------
+# treeview column -> NULL-free sort expression; each has a matching
+# (expression, id) index created by init_sort_indexes
+SORT_COLUMNS = {
+    "ID": "id",
+    "Fav": "COALESCE(favorite, FALSE)",
+    "Title": "title",
+    "Author": "COALESCE(author, '')",
+    "Genre": "COALESCE(genre, '')",
+    "Start Date": "COALESCE(date_started, '-infinity'::date)",
+    "End Date": "COALESCE(date_completed, '-infinity'::date)",
+    "Status": "COALESCE(status, '')",
+    "Chaps": "COALESCE(num_chapters, 0)",
+    "Words": "COALESCE(word_count, 0)",
+    "Main Char": "COALESCE(main_character, '')",
+    "Updated": "COALESCE(last_updated, '-infinity'::date)",
+}
+
+# the same sort keys over the SQLite snapshot, where dates are ISO text
+CACHE_SORT_COLUMNS = dict(
+    SORT_COLUMNS,
+    **{"Fav": "COALESCE(favorite, 0)",
+       "Start Date": "COALESCE(date_started, '')",
+       "End Date": "COALESCE(date_completed, '')",
+       "Updated": "COALESCE(last_updated, '')"},
+)
+
+def _sort_index_name(column):
+    return "stories_sort_" + re.sub(r"\W+", "_", column.lower()) + "_idx"
+
+def init_sort_indexes(con):
+    """Create the indexes behind column sorting and filtering (autocommit)."""
+    for column, expr in SORT_COLUMNS.items():
+        if column != "ID":
+            create_index_concurrently(con, _sort_index_name(column),
+                                      f"stories (({expr}), id)")
+    create_index_concurrently(con, "stories_favorite_idx", "stories (id) WHERE favorite")
+
+def filter_conditions(filters, columns):
+    """Yield (condition, values) for `filters`, using the `columns` sort keys.
+
+    Conditions use %s placeholders; see build_story_query for the filters.
+    """
+    if filters.get("genre"):
+        yield f"{columns['Genre']} = %s", (filters["genre"],)
+    if filters.get("status"):
+        yield f"{columns['Status']} = %s", (filters["status"],)
+    if filters.get("favorite"):
+        yield "favorite", ()
+    ranges = (("started", "Start Date"), ("updated", "Updated"), ("words", "Words"))
+    for prefix, column in ranges:
+        low = filters.get(f"{prefix}_from", filters.get(f"{prefix}_min"))
+        high = filters.get(f"{prefix}_to", filters.get(f"{prefix}_max"))
+        if low is not None:
+            yield f"{columns[column]} >= %s", (low,)
+        if high is not None:
+            yield f"{columns[column]} <= %s", (high,)
+
+def build_story_query(filters=None, sort="ID", descending=False, after=None,
+                      limit=SORT_PAGE_SIZE):
+    """Build a parameterized keyset-paginated query over stories.
+
+    `filters` may hold genre, status, favorite (True to keep favorites only),
+    started_from/started_to, updated_from/updated_to and words_min/words_max.
+    `sort` is a key of SORT_COLUMNS. `after` is the (sort value, id) key of
+    the last row already shown. The query returns (id, sort value) rows with
+    the sort value as text: psycopg2 would read '-infinity' back as
+    date.min, so the key is kept in the form PostgreSQL parses unchanged.
+    Returns (sql, params).
+    """
+    filters = filters or {}
+    expr = SORT_COLUMNS[sort]
+    where, params = [], []
+
+    def add(condition, *values):
+        where.append(condition)
+        params.extend(values)
+
+    for condition, values in filter_conditions(filters, SORT_COLUMNS):
+        add(condition, *values)
+
+    op = "<" if descending else ">"
+    if after is not None:
+        if sort == "ID":
+            add(f"id {op} %s", after[1])
+        else:
+            add(f"({expr}, id) {op} (%s, %s)", *after)
+
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT id, ({expr})::text FROM stories"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if sort == "ID":
+        sql += f" ORDER BY id {direction} LIMIT %s"
+    else:
+        sql += f" ORDER BY {expr} {direction}, id {direction} LIMIT %s"
+    params.append(limit)
+    return sql, params
+
+def query_story_page(con, filters=None, sort="ID", descending=False, after=None,
+                     limit=SORT_PAGE_SIZE):
+    """Return (ids, key of the last row) for one page of a sorted/filtered view."""
+    sql, params = build_story_query(filters, sort, descending, after, limit)
+    cur = con.cursor()
+    execute_prepared(cur, sql, params)
+    rows = cur.fetchall()
+    con.commit()
+    last = (rows[-1][1], rows[-1][0]) if rows else after
+    return array("q", (row[0] for row in rows)), last
+
+# ---------- chapter DB helpers ----------
+def init_chapters_table(con):
+    """Create the chapters table (one row per story chapter)."""
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chapters (
+            story_id INTEGER NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+            chapter_no INTEGER NOT NULL,
+            title TEXT,
+            content TEXT NOT NULL DEFAULT '',
+            word_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (story_id, chapter_no)
+        )
+    """)
+
+def count_words(text):
+    """Count whitespace-separated words."""
+    return len(text.split())
+
+def save_chapter(con, story_id, content, chapter_no=None, title=None):
+    """Write a chapter in one transaction; return (chapter_no, story row).
+
+    Without `chapter_no` (or if that chapter is gone) the next chapter is
+    appended; otherwise its text is replaced. The story row is locked
+    while this happens, so two writers can't claim the same number;
+    num_chapters, word_count (by the change in words) and last_updated
+    move with it, and the change is logged as writing activity. Returns
+    (None, None) if the story no longer exists.
+    """
+    words = count_words(content)
+    cur = con.cursor()
+    cur.execute("SELECT 1 FROM stories WHERE id = %s FOR UPDATE", (story_id,))
+    if cur.fetchone() is None:
+        con.rollback()
+        return None, None
+    old_words = None
+    if chapter_no is not None:
+        cur.execute("SELECT word_count FROM chapters WHERE story_id = %s AND chapter_no = %s",
+                    (story_id, chapter_no))
+        row = cur.fetchone()
+        old_words = row[0] if row else None
+    if old_words is None:
+        cur.execute("""
+            INSERT INTO chapters (story_id, chapter_no, title, content, word_count)
+            SELECT %s, COALESCE(MAX(chapter_no), 0) + 1, %s, %s, %s
+            FROM chapters WHERE story_id = %s
+            RETURNING chapter_no
+        """, (story_id, title, content, words, story_id))
+        chapter_no = cur.fetchone()[0]
+        added, delta = 1, words
+    else:
+        cur.execute("""
+            UPDATE chapters SET content = %s, word_count = %s
+            WHERE story_id = %s AND chapter_no = %s
+        """, (content, words, story_id, chapter_no))
+        added, delta = 0, words - old_words
+    cur.execute(f"""
+        UPDATE stories
+        SET num_chapters = COALESCE(num_chapters, 0) + %s,
+            word_count = COALESCE(word_count, 0) + %s,
+            last_updated = CURRENT_DATE
+        WHERE id = %s
+        RETURNING {STORY_COLUMNS}
+    """, (added, delta, story_id))
+    row = cur.fetchone()
+    log_writing(con, story_id, delta)
+    con.commit()
+    return chapter_no, Story.from_row(row)
+
+def append_chapter(con, story_id, content, title=None):
+    """Add the next chapter to a story; return the updated row (None if gone)."""
+    return save_chapter(con, story_id, content, title=title)[1]
+
+def fetch_chapters(con, story_id, after_no=0, limit=CHAPTER_PAGE_SIZE):
+    """Return the next page of (chapter_no, title, content) after `after_no`."""
+    cur = con.cursor()
+    execute_prepared(cur, """
+        SELECT chapter_no, title, content
+        FROM chapters
+        WHERE story_id = %s AND chapter_no > %s
+        ORDER BY chapter_no
+        LIMIT %s
+    """, (story_id, after_no, limit))
+    rows = cur.fetchall()
+    con.commit()
+    return rows
+
+# ---------- chapter autosave journal ----------
+def _common_prefix(a, b):
+    # binary search over slice comparisons: C-speed even for long chapters
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _splice(old, new):
+    """Return (at, deleted, inserted) turning `old` into `new`."""
+    at = _common_prefix(old, new)
+    tail = _common_prefix(old[at:][::-1], new[at:][::-1])
+    return at, len(old) - at - tail, new[at:len(new) - tail]
+
+class ChapterJournal:
+    """Append-only local journal of one chapter draft, replayed after a crash.
+
+    Each record() appends the edit since the previous one as a JSON line
+    (a splice, not the whole text) and flushes it to the OS; fsync runs at
+    most every JOURNAL_FSYNC_INTERVAL seconds, or on sync(). mark_flushed()
+    notes what reached the database, so `pending` survives a restart too.
+    A line torn by a crash is cut off when the journal is reopened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.story_id = None
+        self.title = None
+        self.chapter_no = None
+        self.text = ""
+        self.seq = 0            # edits recorded
+        self.flushed_seq = 0    # edits known to be in the database
+        self.flushed_words = 0  # words the database holds for the chapter
+        self._synced_at = time.monotonic()
+        self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def create(cls, story_id, title="", directory=JOURNAL_DIR):
+        """Start a journal for a new chapter of `story_id`."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{story_id}-{uuid.uuid4().hex}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"story_id": story_id, "title": title}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path)
+
+    @classmethod
+    def recover(cls, directory=JOURNAL_DIR):
+        """Reopen every journal left behind (oldest first); unreadable ones are skipped."""
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith(".jsonl")]
+        except FileNotFoundError:
+            return []
+        paths = sorted((os.path.join(directory, n) for n in names), key=os.path.getmtime)
+        journals = []
+        for path in paths:
+            try:
+                journal = cls(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if journal.story_id is not None:
+                journals.append(journal)
+            else:
+                journal.close()
+        return journals
+
+    def _apply(self, record):
+        if "story_id" in record:
+            self.story_id = record["story_id"]
+            self.title = record.get("title")
+        elif "flushed" in record:
+            self.flushed_seq = record["flushed"]
+            self.chapter_no = record["chapter_no"]
+            self.flushed_words = record.get("words", 0)
+        elif "text" in record:
+            self.text = record["text"]
+            self.seq = record["seq"]
+        else:
+            at = record["at"]
+            self.text = self.text[:at] + record["ins"] + self.text[at + record["del"]:]
+            self.seq = record["seq"]
+
+    def _replay(self):
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    break
+                good += len(line)
+            f.seek(0, os.SEEK_END)
+            torn = f.tell() > good
+        if torn:
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def _append(self, record, sync=False):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if sync or time.monotonic() - self._synced_at >= JOURNAL_FSYNC_INTERVAL:
+            self.sync()
+
+    @property
+    def pending(self):
+        """True if the journal holds edits the database hasn't seen."""
+        return self.seq > self.flushed_seq
+
+    def record(self, text):
+        """Journal the draft's current text; return False if nothing changed."""
+        if text == self.text:
+            return False
+        at, deleted, inserted = _splice(self.text, text)
+        self.seq += 1
+        self.text = text
+        self._append({"seq": self.seq, "at": at, "del": deleted, "ins": inserted})
+        if self._file.tell() > JOURNAL_COMPACT_BYTES:
+            self.compact()
+        return True
+
+    def mark_flushed(self, seq, chapter_no, words):
+        """Note that edits up to `seq` were saved as chapter `chapter_no` (`words` long)."""
+        self.flushed_seq = max(self.flushed_seq, seq)
+        self.chapter_no = chapter_no
+        self.flushed_words = words
+        self._append({"flushed": self.flushed_seq, "chapter_no": chapter_no,
+                      "words": words}, sync=True)
+
+    def sync(self):
+        """Force journaled edits to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced_at = time.monotonic()
+
+    def compact(self):
+        """Replace the edit history with one snapshot (atomic rename)."""
+        records = [{"story_id": self.story_id, "title": self.title},
+                   {"seq": self.seq, "text": self.text}]
+        if self.chapter_no is not None:
+            records.append({"flushed": self.flushed_seq, "chapter_no": self.chapter_no,
+                            "words": self.flushed_words})
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._synced_at = time.monotonic()
+
+    def close(self, discard=False):
+        """Close the journal; `discard` deletes it (the draft is done with)."""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+        if discard:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+# ---------- bulk import / export ----------
+IMPORT_COLUMNS = ("favorite", "title", "author", "genre", "date_started",
+                  "date_completed", "status", "num_chapters", "word_count",
+                  "main_character", "last_updated", "preview")
+EXPORT_COLUMNS = ("id",) + IMPORT_COLUMNS
+
+class _ProgressWriter(io.TextIOBase):
+    """Text file wrapper for COPY ... TO STDOUT that reports lines written.
+
+    It must be a TextIOBase so psycopg2 hands it str rather than bytes.
+    """
+
+    def __init__(self, f, on_progress, stop):
+        super().__init__()
+        self.f = f
+        self.on_progress = on_progress
+        self.stop = stop
+        self.lines = 0
+        self._reported = 0
+
+    def write(self, data):
+        if self.stop.is_set():
+            raise TransferCancelled()
+        self.f.write(data)
+        self.lines += data.count("\n")
+        if self.lines - self._reported >= IMPORT_BATCH_SIZE:
+            self._reported = self.lines
+            self.on_progress(self.lines)
+        return len(data)
+
+class TransferCancelled(Exception):
+    """Raised inside an import/export when the user cancels it."""
+
+def _copy_field(value):
+    """Encode one value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value or "").strip().lower()
+    if text in ("", "f", "false", "0", "no", "n"):
+        return False
+    if text in ("t", "true", "1", "yes", "y", "★"):
+        return True
+    raise ValueError(f"not a boolean: {value!r}")
+
+def parse_int(value):
+    if value in (None, ""):
+        return 0
+    number = int(value)
+    if number < 0:
+        raise ValueError(f"negative count: {value!r}")
+    return number
+
+def parse_date(value):
+    if value in (None, ""):
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+def parse_text(value):
+    return None if value in (None, "") else str(value)
+
+def validate_story_record(record):
+    """Turn one imported record (dict) into a tuple of IMPORT_COLUMNS.
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    title = str(record.get("title") or "").strip()
+    if not title:
+        raise ValueError("title is required")
+    return (
+        parse_bool(record.get("favorite")),
+        title,
+        parse_text(record.get("author")),
+        parse_text(record.get("genre")),
+        parse_date(record.get("date_started")),
+        parse_date(record.get("date_completed")),
+        parse_text(record.get("status")),
+        parse_int(record.get("num_chapters")),
+        parse_int(record.get("word_count")),
+        parse_text(record.get("main_character")),
+        parse_date(record.get("last_updated")),
+        str(record.get("preview") or ""),
+    )
+
+def _read_records(f, fmt):
+    """Yield (line_no, record) from an open CSV or JSONL file.
+
+    A JSONL line that doesn't parse is yielded as its ValueError.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError as e:
+                    yield line_no, e
+
+def transfer_format(path):
+    """Return 'csv' or 'jsonl' from a file name."""
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def import_stories(con, path, on_progress, stop):
+    """Bulk-load stories from a CSV or JSONL file with COPY ... FROM STDIN.
+
+    The file is read as a stream and validated IMPORT_BATCH_SIZE records at
+    a time; each valid batch is sent as one COPY. Ids in the file are
+    ignored (new ids are assigned). Invalid records are skipped and listed
+    in the result. Everything is committed in one transaction at the end.
+    `on_progress(fraction, imported)` is called from the worker thread.
+    Returns (imported, [(line_no, error), ...]).
+    """
+    size = max(os.path.getsize(path), 1)
+    fmt = transfer_format(path)
+    cur = con.cursor()
+    copy_sql = f"COPY stories ({', '.join(IMPORT_COLUMNS)}) FROM STDIN"
+    imported = 0
+    errors = []
+    batch = io.StringIO()
+    batch_rows = 0
+
+    def flush():
+        nonlocal batch, batch_rows, imported
+        if batch_rows:
+            batch.seek(0)
+            cur.copy_expert(copy_sql, batch)
+            imported += batch_rows
+        batch = io.StringIO()
+        batch_rows = 0
+
+    with open(path, newline="", encoding="utf-8") as f:
+        for line_no, record in _read_records(f, fmt):
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                values = validate_story_record(record)
+            except (ValueError, TypeError) as e:
+                errors.append((line_no, str(e)))
+                continue
+            batch.write("\t".join(_copy_field(v) for v in values) + "\n")
+            batch_rows += 1
+            if batch_rows >= IMPORT_BATCH_SIZE:
+                if stop.is_set():
+                    raise TransferCancelled()
+                flush()
+                on_progress(min(f.buffer.tell() / size, 1.0), imported)
+        flush()
+    con.commit()
+    on_progress(1.0, imported)
+    return imported, errors
+
+def export_stories(con, path, on_progress, stop):
+    """Stream every story to a CSV or JSONL file with COPY ... TO STDOUT.
+
+    Rows go straight from the server into the file, so memory use doesn't
+    depend on the library size. `on_progress(fraction, exported)` is
+    called from the worker thread. Returns the number of rows written.
+    """
+    cur = con.cursor()
+    # the whole export is one statement, however long the file takes to write
+    cur.execute("SET LOCAL statement_timeout = 0")
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'stories'::regclass")
+    estimate = cur.fetchone()[0]
+    if estimate <= 0:
+        # never analyzed (-1 on PG14+, 0 before): count instead
+        cur.execute("SELECT count(*) FROM stories")
+        estimate = cur.fetchone()[0]
+    estimate = max(estimate, 1)
+    columns = ", ".join(EXPORT_COLUMNS)
+    if transfer_format(path) == "csv":
+        copy_sql = (f"COPY (SELECT {columns} FROM stories ORDER BY id) "
+                    "TO STDOUT WITH (FORMAT csv, HEADER true)")
+    else:
+        # one JSON object per line; the odd quote/delimiter stop CSV quoting
+        copy_sql = (f"COPY (SELECT row_to_json(s) FROM (SELECT {columns} "
+                    "FROM stories ORDER BY id) s) TO STDOUT "
+                    "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = _ProgressWriter(
+            f, lambda lines: on_progress(min(lines / estimate, 1.0), lines), stop)
+        cur.copy_expert(copy_sql, writer)
+    con.commit()
+    exported = writer.lines - (1 if transfer_format(path) == "csv" else 0)
+    on_progress(1.0, exported)
+    return exported
+
+# ---------- change tracking + local cache ----------
+def init_change_tracking(con):
+    """Number every story change so caches can pull just the delta.
+
+    Inserts and updates stamp `change_seq` from one sequence; deletes leave
+    a tombstone in `stories_deleted` with the next number. Updates also
+    bump `version`.
+    """
+    cur = con.cursor()
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS stories_change_seq")
+    cur.execute("""
+        ALTER TABLE stories ADD COLUMN IF NOT EXISTS change_seq BIGINT
+        NOT NULL DEFAULT nextval('stories_change_seq')
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS stories_change_seq_idx ON stories (change_seq)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stories_deleted (
+            id INTEGER PRIMARY KEY,
+            change_seq BIGINT NOT NULL DEFAULT nextval('stories_change_seq')
+        )
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION stories_track_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO stories_deleted (id) VALUES (OLD.id)
+                ON CONFLICT (id) DO UPDATE SET change_seq = nextval('stories_change_seq');
+                RETURN OLD;
+            END IF;
+            NEW.change_seq := nextval('stories_change_seq');
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER stories_track_update
+        BEFORE UPDATE ON stories
+        FOR EACH ROW EXECUTE FUNCTION stories_track_change()
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER stories_track_delete
+        AFTER DELETE ON stories
+        FOR EACH ROW EXECUTE FUNCTION stories_track_change()
+    """)
+
+class LocalCache:
+    """On-disk SQLite snapshot of `stories` and `reading_streak`.
+
+    It paints the table at launch before PostgreSQL answers and keeps the
+    app readable when the server is down. `last_seq` is the highest
+    `change_seq` already copied. Safe to use from the Tk thread and the
+    DB worker at once.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS stories (
+                    id INTEGER PRIMARY KEY, favorite INTEGER, title TEXT,
+                    author TEXT, genre TEXT, date_started TEXT,
+                    date_completed TEXT, status TEXT, num_chapters INTEGER,
+                    word_count INTEGER, main_character TEXT, last_updated TEXT,
+                    preview TEXT, change_seq INTEGER, version INTEGER
+                )
+            """)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(stories)")}
+            if "version" not in columns:  # snapshot from before versioning
+                self._db.execute("ALTER TABLE stories ADD COLUMN version INTEGER")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS reading_streak (
+                    id INTEGER PRIMARY KEY, last_read_date TEXT,
+                    current_streak INTEGER, longest_streak INTEGER
+                )
+            """)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+    @staticmethod
+    def _plain(value):
+        return value.isoformat() if isinstance(value, date) else value
+
+    def has_snapshot(self):
+        return self.last_seq() > 0
+
+    def last_seq(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'last_seq'").fetchone()
+        return int(row[0]) if row else 0
+
+    def story_ids(self, filters=None, sort="ID", descending=False):
+        """Offline stand-in for query_story_page: every matching id, in order."""
+        where, params = [], []
+        for condition, values in filter_conditions(filters or {}, CACHE_SORT_COLUMNS):
+            where.append(condition.replace("%s", "?"))
+            params.extend(self._plain(v) for v in values)
+        direction = "DESC" if descending else "ASC"
+        sql = "SELECT id FROM stories"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if sort == "ID":
+            sql += f" ORDER BY id {direction}"
+        else:
+            sql += f" ORDER BY {CACHE_SORT_COLUMNS[sort]} {direction}, id {direction}"
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            return array("q", (row[0] for row in cur))
+
+    def fetch_rows(self, ids):
+        """Return {id: Story} for the ids present in the cache."""
+        ids = list(ids)
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {STORY_FIELD_LIST} FROM stories WHERE id IN ({marks})",
+                ids).fetchall()
+        return {row[0]: Story.from_row(row) for row in rows}
+
+    def change_seqs(self, ids):
+        """Return {id: change_seq} for the ids present in the cache."""
+        ids = list(ids)
+        seqs = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):  # under SQLite's variable limit
+                chunk = ids[start:start + 500]
+                seqs.update(self._db.execute(
+                    f"SELECT id, change_seq FROM stories "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return seqs
+
+    def search_ids(self, term):
+        """Offline stand-in for the server search: substring match."""
+        like = f"%{term.strip().lower()}%"
+        with self._lock:
+            cur = self._db.execute("""
+                SELECT id FROM stories
+                WHERE lower(title) LIKE ? OR lower(author) LIKE ?
+                   OR lower(main_character) LIKE ? OR lower(genre) LIKE ?
+                ORDER BY id
+            """, (like,) * 4)
+            return array("q", (row[0] for row in cur))
+
+    def get_streak(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_read_date, current_streak, longest_streak "
+                "FROM reading_streak WHERE id = 1").fetchone()
+        return row if row else (None, 0, 0)
+
+    def apply_changes(self, rows, deleted_ids, last_seq, streak=None):
+        """Store changed rows (STORY_FIELDS + change_seq) in one transaction."""
+        with self._lock, self._db:
+            marks = ", ".join("?" * (len(STORY_FIELDS) + 1))
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO stories ({STORY_FIELD_LIST}, change_seq) "
+                f"VALUES ({marks})",
+                ([self._plain(v) for v in row] for row in rows))
+            if deleted_ids:
+                self._db.executemany("DELETE FROM stories WHERE id = ?",
+                                     ((i,) for i in deleted_ids))
+            if streak is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO reading_streak VALUES (1, ?, ?, ?)",
+                    [self._plain(v) for v in streak])
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('last_seq', ?)", (last_seq,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def sync_local_cache(con, cache):
+    """Copy story changes made since the cache's last sync into it.
+
+    Rows are streamed by `change_seq` (re-reading a small overlap, since
+    sequence numbers can commit out of order) and applied in chunks;
+    tombstones remove deleted stories. Returns (changed ids, deleted ids)
+    for the rows that really differed from the cache, so a table painted
+    from it can be brought up to date in place; the overlap re-read
+    contributes only rows whose change_seq moved.
+    """
+    since = max(cache.last_seq() - SYNC_OVERLAP, 0)
+    cur = con.cursor()
+    cur.execute("SELECT id, change_seq FROM stories_deleted WHERE change_seq > %s",
+                (since,))
+    tombstones = cur.fetchall()
+    last_seq = max([cache.last_seq()] + [seq for _, seq in tombstones])
+    cur.execute("SELECT last_read_date, current_streak, longest_streak "
+                "FROM reading_streak WHERE id = 1")
+    streak = cur.fetchone()
+
+    changed = array("q")
+    stream = con.cursor(name="sync_local_cache")
+    stream.itersize = STREAM_ITERSIZE
+    stream.execute(f"""
+        SELECT {STORY_COLUMNS}, change_seq FROM stories
+        WHERE change_seq > %s ORDER BY change_seq
+    """, (since,))
+    while True:
+        rows = stream.fetchmany(STREAM_ITERSIZE)
+        if not rows:
+            break
+        last_seq = max(last_seq, rows[-1][-1])
+        known = cache.change_seqs(row[0] for row in rows)
+        rows = [row for row in rows if known.get(row[0]) != row[-1]]
+        changed.extend(row[0] for row in rows)
+        cache.apply_changes(rows, (), last_seq)
+    stream.close()
+    con.commit()
+    deleted = list(cache.change_seqs(story_id for story_id, _ in tombstones))
+    cache.apply_changes((), deleted, max(last_seq, 1), streak)
+    return changed, deleted
+
+# ---------- live change notifications ----------
+def init_change_notify(con):
+    """Announce story and streak changes on NOTIFY_CHANNEL.
+
+    Statement-level triggers send one JSON notification per statement:
+    {"table": "stories", "op": ..., "ids": [...]}, or "ids": null when a
+    statement touched more than NOTIFY_MAX_IDS rows (listeners reload), and
+    {"table": "reading_streak"} for streak updates. Nothing is sent for a
+    transaction that rolls back.
+    """
+    cur = con.cursor()
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION stories_notify_change() RETURNS trigger AS $$
+        DECLARE
+            ids JSON;
+        BEGIN
+            SELECT json_agg(id) INTO ids
+            FROM (SELECT id FROM changed LIMIT {NOTIFY_MAX_IDS + 1}) c;
+            IF ids IS NULL THEN
+                RETURN NULL;  -- the statement changed no rows
+            END IF;
+            IF json_array_length(ids) > {NOTIFY_MAX_IDS} THEN
+                ids := NULL;
+            END IF;
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object(
+                'table', 'stories', 'op', TG_OP, 'ids', ids)::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # transition tables allow a single event per trigger
+    for op, table in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cur.execute(f"""
+            CREATE OR REPLACE TRIGGER stories_notify_{op.lower()}
+            AFTER {op} ON stories
+            REFERENCING {table} TABLE AS changed
+            FOR EACH STATEMENT EXECUTE FUNCTION stories_notify_change()
+        """)
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION reading_streak_notify_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', '{{"table": "reading_streak"}}');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER reading_streak_notify
+        AFTER INSERT OR UPDATE ON reading_streak
+        FOR EACH STATEMENT EXECUTE FUNCTION reading_streak_notify_change()
+    """)
+
+class ChangeListener:
+    """Background thread that LISTENs on NOTIFY_CHANNEL.
+
+    Every batch of notifications that arrives together is decoded and
+    passed to `on_change(changes)` on the listener thread, as a list of
+    the JSON payloads described in init_change_notify. The listener keeps
+    its own connection outside the pool and reconnects after
+    `retry_after` seconds if it drops.
+    """
+
+    def __init__(self, on_change, connect=None, retry_after=5):
+        self.on_change = on_change
+        self.connect = connect or get_connection
+        self.retry_after = retry_after
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="change-listener",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            con = None
+            try:
+                con = self.connect()
+                con.autocommit = True
+                con.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while not self._stop.is_set():
+                    # wake up now and then to notice stop()
+                    if select.select([con], [], [], 1.0)[0]:
+                        con.poll()
+                        self._deliver(con)
+            except psycopg2.Error:
+                self._stop.wait(self.retry_after)
+            finally:
+                if con is not None:
+                    try:
+                        con.close()
+                    except psycopg2.Error:
+                        pass
+
+    def _deliver(self, con):
+        changes = []
+        while con.notifies:
+            notify = con.notifies.pop(0)
+            try:
+                changes.append(json.loads(notify.payload))
+            except ValueError:
+                pass
+        if changes:
+            self.on_change(changes)
+
+# ---------- in-memory row store ----------
+class StoryStore:
+    """Id-indexed LRU map of the Story records the app holds in memory.
+
+    The table, the library window and the form read rows from here, so a
+    selected story is a dict lookup rather than a re-parse of widget values.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._rows = OrderedDict()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, story_id):
+        return story_id in self._rows
+
+    def get(self, story_id):
+        """Return the Story for `story_id`, or None if it isn't held."""
+        return self._rows.get(story_id)
+
+    def put(self, story):
+        """Store `story`, replacing any older copy."""
+        self._rows[story.id] = story
+        self._rows.move_to_end(story.id)
+
+    def setdefault(self, story):
+        """Store `story` unless a (newer) copy is already held."""
+        self._rows.setdefault(story.id, story)
+
+    def touch(self, ids):
+        """Mark `ids` as recently used."""
+        for story_id in ids:
+            if story_id in self._rows:
+                self._rows.move_to_end(story_id)
+
+    def discard(self, story_id):
+        self._rows.pop(story_id, None)
+
+    def trim(self, keep=()):
+        """Evict least recently used rows down to capacity, sparing `keep`."""
+        checked = 0
+        while len(self._rows) > self.capacity and checked < len(self._rows):
+            story_id, story = self._rows.popitem(last=False)
+            if story_id in keep:
+                self._rows[story_id] = story
+                checked += 1
+
+# ---------- similar stories ----------
+# hashed features per field, with the weight each occurrence adds
+SIMILAR_FIELDS = (("genre", "g:", 3.0, False), ("author", "a:", 3.0, False),
+                  ("main_character", "c:", 2.0, False), ("title", "w:", 2.0, True),
+                  ("preview", "w:", 1.0, True))
+
+def story_features(title, author, genre, main_character, preview):
+    """Return (sorted hashed feature ids, damped weights) for one story.
+
+    Genre, author and main character are whole-value features; title and
+    preview contribute their words. crc32 keeps the hashing stable across runs.
+    """
+    values = {"title": title, "author": author, "genre": genre,
+              "main_character": main_character, "preview": preview}
+    counts = {}
+    for field, prefix, weight, split in SIMILAR_FIELDS:
+        text = (values[field] or "").strip().lower()
+        if not text:
+            continue
+        for token in re.findall(r"\w{3,}", text) if split else (text,):
+            feature = zlib.crc32((prefix + token).encode()) & (SIMILAR_DIM - 1)
+            counts[feature] = counts.get(feature, 0.0) + weight
+    feats = np.fromiter(counts, np.uint32, len(counts))
+    weights = np.log1p(np.fromiter(counts.values(), np.float32, len(counts)))
+    order = np.argsort(feats)
+    return feats[order], weights[order]
+
+class SimilarityIndex:
+    """Hashed TF-IDF vectors of every story, for instant "similar stories".
+
+    Rows are kept CSR-style (row_ptr/feat/weight) plus an inverted index
+    (feat_ptr/post_row/post_weight) over the first `indexed` rows, so a
+    query sums a handful of posting lists with np.bincount instead of
+    touching every story. Changed stories get a fresh row at the end and
+    their old row is marked dead; rows past `indexed` are scored directly
+    until enough pile up to rebuild. Thread-safe: syncs run on the DB
+    worker while the UI queries.
+    """
+
+    def __init__(self, path=SIMILAR_PATH):
+        self.path = path
+        self.ids = np.zeros(0, np.int64)         # story id per row
+        self.seqs = np.zeros(0, np.int64)        # change_seq the row was built from
+        self.row_ptr = np.zeros(1, np.int64)
+        self.feat = np.zeros(0, np.uint32)
+        self.weight = np.zeros(0, np.float32)
+        self.norm = np.zeros(0, np.float32)
+        self.alive = np.zeros(0, bool)
+        self.row_of = np.zeros(0, np.int64)      # story id -> row + 1 (0: none)
+        self.df = np.zeros(SIMILAR_DIM, np.int32)
+        self.feat_ptr = np.zeros(SIMILAR_DIM + 1, np.int64)
+        self.post_row = np.zeros(0, np.int32)
+        self.post_weight = np.zeros(0, np.float32)
+        self.indexed = 0
+        self.last_seq = 0
+        self._pending = {}                       # story id -> (seq, feats, weights)
+        self._dirty = False                      # changed since the last save/load
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return int(self.alive.sum()) + len(self._pending)
+
+    # -- changes --
+    def _row(self, story_id):
+        if story_id < len(self.row_of) and self.row_of[story_id]:
+            row = self.row_of[story_id] - 1
+            if self.alive[row]:
+                return row
+        return None
+
+    def _current(self, story_id, seq):
+        """True if `story_id` is already indexed at `seq` or later."""
+        pending = self._pending.get(story_id)
+        if pending is not None:
+            return pending[0] >= seq
+        row = self._row(story_id)
+        return row is not None and self.seqs[row] >= seq
+
+    def _drop(self, story_id):
+        old = self._pending.pop(story_id, None)
+        if old is not None:
+            self.df[old[1]] -= 1
+        row = self._row(story_id)
+        if row is not None:
+            self.alive[row] = False
+            self.df[self.feat[self.row_ptr[row]:self.row_ptr[row + 1]]] -= 1
+        return old is not None or row is not None
+
+    def update(self, rows):
+        """Index (id, title, author, genre, main_character, preview, change_seq) rows.
+
+        Rows already indexed at their change_seq (the sync overlap) are
+        skipped before hashing. Returns how many rows were applied.
+        """
+        with self._lock:
+            rows = [row for row in rows if not self._current(row[0], row[-1])]
+        # hashing is the slow part, so it happens outside the lock
+        prepared = [(story_id, seq, story_features(*fields)) for story_id, *fields, seq in rows]
+        applied = 0
+        with self._lock:
+            for story_id, seq, (feats, weights) in prepared:
+                if self._current(story_id, seq):
+                    continue  # another sync got there first
+                self._drop(story_id)
+                self.df[feats] += 1
+                self._pending[story_id] = (seq, feats, weights)
+                applied += 1
+            self._dirty = self._dirty or applied > 0
+        return applied
+
+    def remove(self, story_ids):
+        """Forget deleted stories; return how many were indexed."""
+        with self._lock:
+            removed = sum(self._drop(story_id) for story_id in story_ids)
+            self._dirty = self._dirty or removed > 0
+        return removed
+
+    @property
+    def dirty(self):
+        """True when there are changes the file on disk doesn't have."""
+        return self._dirty
+
+    def _idf(self, feats):
+        alive = int(self.alive.sum()) + len(self._pending)
+        return np.log((1 + alive) / (1 + self.df[feats])).astype(np.float32) + 1
+
+    def _consolidate(self):
+        """Append pending stories as rows (lock held)."""
+        if not self._pending:
+            return
+        story_ids = np.fromiter(self._pending, np.int64, len(self._pending))
+        entries = list(self._pending.values())
+        first = len(self.ids)
+        lengths = np.array([len(feats) for _, feats, _ in entries], np.int64)
+        feat = np.concatenate([feats for _, feats, _ in entries])
+        weight = np.concatenate([weights for _, _, weights in entries])
+        # norms use the idf of the moment; _rebuild() brings them all up to date
+        tf_idf = (weight * self._idf(feat)) ** 2
+        self._pending.clear()
+        owner = np.repeat(np.arange(len(entries)), lengths)
+        norm = np.sqrt(np.bincount(owner, tf_idf, minlength=len(entries))).astype(np.float32)
+
+        self.ids = np.concatenate([self.ids, story_ids])
+        self.seqs = np.concatenate([self.seqs, [seq for seq, _, _ in entries]])
+        self.row_ptr = np.concatenate([self.row_ptr, self.row_ptr[-1] + np.cumsum(lengths)])
+        self.feat = np.concatenate([self.feat, feat])
+        self.weight = np.concatenate([self.weight, weight])
+        self.norm = np.concatenate([self.norm, norm])
+        self.alive = np.concatenate([self.alive, np.ones(len(entries), bool)])
+        if story_ids.max() >= len(self.row_of):
+            grown = np.zeros(int(story_ids.max()) * 2 + 1, np.int64)
+            grown[:len(self.row_of)] = self.row_of
+            self.row_of = grown
+        self.row_of[story_ids] = np.arange(first, len(self.ids)) + 1
+
+    def _rebuild(self):
+        """Drop dead rows, refresh norms and rebuild the postings (lock held)."""
+        keep = np.flatnonzero(self.alive)
+        lengths = np.diff(self.row_ptr)[keep]
+        entries = np.repeat(self.row_ptr[keep] - np.cumsum(lengths) + lengths, lengths) \
+            + np.arange(lengths.sum())
+        self.ids, self.seqs = self.ids[keep], self.seqs[keep]
+        self.feat, self.weight = self.feat[entries], self.weight[entries]
+        self.row_ptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.alive = np.ones(len(keep), bool)
+        self.row_of[:] = 0
+        self.row_of[self.ids] = np.arange(len(self.ids)) + 1
+
+        owner = np.repeat(np.arange(len(keep), dtype=np.int32), lengths)
+        tf_idf = (self.weight * self._idf(self.feat)) ** 2
+        self.norm = np.sqrt(np.bincount(owner, tf_idf, minlength=len(keep))).astype(np.float32)
+        order = np.argsort(self.feat, kind="stable")
+        self.post_row = owner[order]
+        self.post_weight = self.weight[order]
+        self.feat_ptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.feat, minlength=SIMILAR_DIM))])
+        self.indexed = len(self.ids)
+
+    def commit(self, last_seq=None):
+        """Make pending changes queryable; rebuild the postings when due."""
+        with self._lock:
+            self._consolidate()
+            tail = len(self.ids) - self.indexed
+            dead = len(self.alive) - int(self.alive.sum())
+            if tail > SIMILAR_REBUILD_ROWS or dead > SIMILAR_REBUILD_DEAD * max(len(self.alive), 1):
+                self._rebuild()
+            if last_seq is not None:
+                self.last_seq = max(self.last_seq, last_seq)
+
+    # -- queries --
+    def similar(self, story_id, k=SIMILAR_TOP_K):
+        """Return up to `k` (story id, cosine score) pairs most like `story_id`."""
+        with self._lock:
+            self._consolidate()
+            row = self._row(story_id)
+            if row is None:
+                return []
+            qf = self.feat[self.row_ptr[row]:self.row_ptr[row + 1]]
+            idf = self._idf(qf)
+            qv = self.weight[self.row_ptr[row]:self.row_ptr[row + 1]] * idf
+            q_norm = float(np.sqrt((qv ** 2).sum())) or 1.0
+            common = self.df[qf] > max(SIMILAR_MAX_DF * len(self.alive), SIMILAR_MIN_COMMON)
+            qf, qv = qf[~common], (qv * idf)[~common]
+            scores = np.zeros(len(self.ids), np.float32)
+
+            # rows covered by the postings: one bincount over the query's lists
+            starts, ends = self.feat_ptr[qf], self.feat_ptr[qf.astype(np.int64) + 1]
+            lengths = ends - starts
+            if lengths.sum():
+                entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) \
+                    + np.arange(lengths.sum())
+                contrib = self.post_weight[entries] * np.repeat(qv, lengths)
+                scores[:self.indexed] += np.bincount(
+                    self.post_row[entries], contrib, minlength=self.indexed)[:self.indexed]
+
+            # newer rows: match their features against the (sorted) query
+            tail = self.row_ptr[self.indexed]
+            if tail < len(self.feat) and len(qf):
+                feats = self.feat[tail:]
+                pos = np.minimum(np.searchsorted(qf, feats), len(qf) - 1)
+                hit = qf[pos] == feats
+                owner = np.repeat(np.arange(self.indexed, len(self.ids)),
+                                  np.diff(self.row_ptr[self.indexed:]))
+                np.add.at(scores, owner[hit], self.weight[tail:][hit] * qv[pos[hit]])
+
+            scores /= np.where(self.norm > 0, self.norm, 1) * q_norm
+            scores[~self.alive] = 0
+            scores[row] = 0
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k else []
+            top = sorted((i for i in top if scores[i] > 0), key=lambda i: -scores[i])
+            return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+    # -- persistence --
+    def save(self):
+        """Write the index to `path` (atomically) if it changed since the last save.
+
+        Pending changes are folded in. Returns True if the file was written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._consolidate()
+            tmp = self.path + ".tmp.npz"
+            np.savez(tmp, ids=self.ids, seqs=self.seqs, row_ptr=self.row_ptr,
+                     feat=self.feat, weight=self.weight, norm=self.norm, alive=self.alive,
+                     df=self.df, feat_ptr=self.feat_ptr, post_row=self.post_row,
+                     post_weight=self.post_weight,
+                     meta=np.array([self.indexed, self.last_seq, SIMILAR_DIM], np.int64))
+            os.replace(tmp, self.path)
+            self._dirty = False
+        return True
+
+    @classmethod
+    def load(cls, path=SIMILAR_PATH):
+        """Open a saved index; a missing or unreadable file gives an empty one."""
+        index = cls(path)
+        try:
+            with np.load(path) as data:
+                indexed, last_seq, dim = (int(v) for v in data["meta"])
+                if dim != SIMILAR_DIM:
+                    return index  # hashed differently; rebuilt by the next sync
+                for name in ("ids", "seqs", "row_ptr", "feat", "weight", "norm", "alive",
+                             "df", "feat_ptr", "post_row", "post_weight"):
+                    setattr(index, name, data[name])
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return cls(path)
+        index.indexed, index.last_seq = indexed, last_seq
+        if len(index.ids):
+            index.row_of = np.zeros(int(index.ids.max()) + 1, np.int64)
+            live = np.flatnonzero(index.alive)
+            index.row_of[index.ids[live]] = live + 1
+        return index
+
+def open_similarity_index(path=SIMILAR_PATH):
+    """Return the saved SimilarityIndex, or None when NumPy isn't installed."""
+    if np is None:
+        return None
+    return SimilarityIndex.load(path)
+
+def sync_similarity_index(con, index):
+    """Feed story changes since the index's last sync into it.
+
+    The first sync indexes every story. Like sync_local_cache, rows are
+    read by change_seq with a small overlap and tombstones remove deleted
+    stories; the full preview is used, not the list snippet. Returns how
+    many stories changed in the index; saving it is left to the caller.
+    """
+    since = max(index.last_seq - SYNC_OVERLAP, 0)
+    cur = con.cursor()
+    cur.execute("SELECT id, change_seq FROM stories_deleted WHERE change_seq > %s",
+                (since,))
+    tombstones = cur.fetchall()
+    last_seq = max([index.last_seq] + [seq for _, seq in tombstones])
+
+    changed = 0
+    stream = con.cursor(name="sync_similarity_index")
+    stream.itersize = STREAM_ITERSIZE
+    stream.execute("""
+        SELECT id, title, author, genre, main_character, preview, change_seq
+        FROM stories WHERE change_seq > %s ORDER BY change_seq
+    """, (since,))
+    while True:
+        rows = stream.fetchmany(STREAM_ITERSIZE)
+        if not rows:
+            break
+        last_seq = max(last_seq, rows[-1][-1])
+        changed += index.update(rows)
+    stream.close()
+    con.commit()
+    changed += index.remove(story_id for story_id, _ in tombstones)
+    index.commit(last_seq)
+    return changed
+
+# ---------- library shelves ----------
+def init_library_table(con):
+    """Create the library_entries table (one row per story on a shelf)."""
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS library_entries (
+            shelf TEXT NOT NULL DEFAULT 'My Library',
+            story_id INTEGER NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+            added_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (shelf, story_id)
+        )
+    """)
+    # shelf pages are read in (added_at, story_id) order
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS library_entries_page_idx
+        ON library_entries (shelf, added_at, story_id)
+    """)
+    # lets ON DELETE CASCADE find a story's entries without a scan
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS library_entries_story_idx
+        ON library_entries (story_id)
+    """)
+
+def list_shelves(con):
+    """Return [(shelf, story count)] for every non-empty shelf."""
+    cur = con.cursor()
+    cur.execute("""
+        SELECT shelf, count(*) FROM library_entries
+        GROUP BY shelf ORDER BY shelf
+    """)
+    rows = cur.fetchall()
+    con.commit()
+    return rows
+
+def add_to_shelf(con, story_ids, shelf=DEFAULT_SHELF):
+    """Put several stories on a shelf in one statement; return the ids added.
+
+    Stories already on the shelf, or deleted meanwhile, are skipped.
+    """
+    cur = con.cursor()
+    cur.execute("""
+        INSERT INTO library_entries (shelf, story_id)
+        SELECT %s, id FROM stories WHERE id = ANY(%s)
+        ON CONFLICT (shelf, story_id) DO NOTHING
+        RETURNING story_id
+    """, (shelf, list(story_ids)))
+    added = [row[0] for row in cur.fetchall()]
+    con.commit()
+    return added
+
+def remove_from_shelf(con, story_ids, shelf=DEFAULT_SHELF):
+    """Take several stories off a shelf in one statement; return the ids removed."""
+    cur = con.cursor()
+    cur.execute("""
+        DELETE FROM library_entries
+        WHERE shelf = %s AND story_id = ANY(%s)
+        RETURNING story_id
+    """, (shelf, list(story_ids)))
+    removed = [row[0] for row in cur.fetchall()]
+    con.commit()
+    return removed
+
+def fetch_shelf_page(con, shelf=DEFAULT_SHELF, after=None, limit=LIBRARY_PAGE_SIZE):
+    """Return (stories, key of the last entry) for one page of a shelf.
+
+    Entries come in the order they were added, joined to their stories so
+    a page needs one round-trip; `after` is the key returned by the
+    previous page.
+    """
+    columns = story_columns("s.")
+    sql = f"""
+        SELECT e.added_at, {columns}
+        FROM library_entries e
+        JOIN stories s ON s.id = e.story_id
+        WHERE e.shelf = %s
+    """
+    params = [shelf]
+    if after is not None:
+        sql += " AND (e.added_at, e.story_id) > (%s, %s)"
+        params.extend(after)
+    sql += " ORDER BY e.added_at, e.story_id LIMIT %s"
+    params.append(limit)
+    cur = con.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    con.commit()
+    stories = [Story.from_row(row[1:]) for row in rows]
+    last = (rows[-1][0], rows[-1][1]) if rows else after
+    return stories, last
+
+# ---------- schema migrations ----------
+def create_index_concurrently(con, name, definition):
+    """Build an index without blocking writes; `con` must be in autocommit.
+
+    An earlier build that failed part-way leaves an INVALID index behind,
+    which IF NOT EXISTS would keep, so that one is dropped and rebuilt.
+    """
+    cur = con.cursor()
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                (name,))
+    row = cur.fetchone()
+    if row is not None and not row[0]:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+def _baseline_schema(con):
+    # everything is IF NOT EXISTS, so databases created before migrations
+    # existed are adopted as they are
+    init_streak_table(con)
+    init_stories_table(con)
+    init_activity_tables(con)
+    init_chapters_table(con)
+    init_library_table(con)
+    init_change_tracking(con)
+    init_change_notify(con)
+
+# (version, description, transactional, apply(con)), in order. Append new
+# steps; never change one that has shipped. Non-transactional steps run in
+# autocommit (CREATE INDEX CONCURRENTLY) and must be safe to re-run.
+MIGRATIONS = (
+    (1, "baseline schema", True, _baseline_schema),
+    (2, "sort and filter indexes", False, init_sort_indexes),
+)
+MIGRATION_LOCK = 7_250_001  # advisory lock key held while migrating
+
+def schema_version(con):
+    """Return the last applied migration (0 for a schema without any).
+
+    Only current_schema() is looked at: with a search_path such as
+    "scratch,public", a migrated public schema must not make an empty
+    scratch schema look current.
+    """
+    cur = con.cursor()
+    cur.execute("SELECT to_regclass(format('%I.schema_version', current_schema()))")
+    table = cur.fetchone()[0]
+    version = 0
+    if table is not None:
+        cur.execute(f"SELECT COALESCE(max(version), 0) FROM {table}")
+        version = cur.fetchone()[0]
+    con.commit()
+    return version
+
+def migrate(con):
+    """Apply pending MIGRATIONS in order; return the versions applied.
+
+    A current schema costs two small queries. Otherwise an advisory lock
+    keeps two instances from migrating at once (or from creating the
+    schema_version table together), and each transactional step commits
+    together with its schema_version row.
+    """
+    if schema_version(con) >= MIGRATIONS[-1][0]:
+        return []
+    cur = con.cursor()
+    # index builds on a big table (or waiting for another instance running
+    # them) may take longer than a UI statement
+    cur.execute("SET statement_timeout = 0")
+    con.commit()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+    con.commit()
+    applied = []
+    try:
+        # created under the lock: two first launches must not race on the DDL
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        con.commit()
+        current = schema_version(con)  # another instance may have got there first
+        for version, description, transactional, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            if transactional:
+                apply(con)
+            else:
+                con.autocommit = True
+                try:
+                    apply(con)
+                finally:
+                    con.autocommit = False
+            cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description))
+            con.commit()
+            applied.append(version)
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+        cur.execute("RESET statement_timeout")
+        con.commit()
+    return applied
+
+def init_database(con):
+    """Bring the schema up to date; return the streak for startup."""
+    migrate(con)
+    return get_streak(con)